@@ -0,0 +1,120 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from registro import COLUNAS, TOTAL_DIAS
+
+COLUNAS_DIAS = [f'dia{dia}' for dia in range(1, TOTAL_DIAS + 1)]
+
+
+class Analise:
+    # Indicadores da campanha calculados de forma vetorizada sobre a matriz
+    # de presenças (uma linha por pessoa, uma coluna uint8 por dia).
+
+    def __init__(self, pessoas):
+        self.cadastro = pd.DataFrame(list(pessoas), columns=COLUNAS).fillna('')
+        self.presencas = (self.cadastro[COLUNAS_DIAS].to_numpy() == '1').astype(np.uint8)
+        self._agrupados = {}  # A análise não muda depois de montada
+
+    def totais_por_dia(self):
+        return self.presencas.sum(axis=0, dtype=np.int64)
+
+    def variacao_por_dia(self):
+        return np.diff(self.totais_por_dia(), prepend=0)
+
+    def dias_por_pessoa(self):
+        return self.presencas.sum(axis=1, dtype=np.int64)
+
+    def retencao(self):
+        # Quantas pessoas vieram em exatamente N dos dias da campanha
+        contagem = np.bincount(self.dias_por_pessoa(), minlength=TOTAL_DIAS + 1)
+        return pd.DataFrame({'dias_presentes': np.arange(TOTAL_DIAS + 1),
+                             'pessoas': contagem})
+
+    def _agrupar(self, coluna):
+        # Agrupa ignorando espaços e maiúsculas ("Flores " e "flores")
+        if coluna in self._agrupados:
+            return self._agrupados[coluna]
+        chave = self.cadastro[coluna].str.strip().str.casefold()
+        tabela = pd.DataFrame({
+            coluna: self.cadastro[coluna].str.strip(),
+            'chave': chave,
+            'pessoas': 1,
+            'presencas': self.dias_por_pessoa(),
+        })
+        agrupado = tabela.groupby('chave', sort=False).agg(
+            {coluna: 'first', 'pessoas': 'sum', 'presencas': 'sum'})
+        self._agrupados[coluna] = agrupado.sort_values(
+            ['pessoas', coluna], ascending=[False, True]).reset_index(drop=True)
+        return self._agrupados[coluna]
+
+    def por_bairro(self):
+        return self._agrupar('bairro')
+
+    def por_como_soube(self):
+        return self._agrupar('como_soube')
+
+    def por_dia(self, datas):
+        totais = self.totais_por_dia()
+        return pd.DataFrame({'data': list(datas)[:TOTAL_DIAS],
+                             'presentes': totais[:len(datas)],
+                             'variacao': self.variacao_por_dia()[:len(datas)]})
+
+    def planilhas(self, datas):
+        # Abas do Excel de indicadores, na ordem em que aparecem
+        cadastro = self.cadastro.copy()
+        for coluna in ['id', 'idade']:
+            cadastro[coluna] = pd.to_numeric(cadastro[coluna], errors='coerce')
+        return {
+            'Cadastro': cadastro,
+            'Por dia': self.por_dia(datas),
+            'Retenção': self.retencao(),
+            'Bairros': self.por_bairro(),
+            'Como soube': self.por_como_soube(),
+        }
+
+
+# Idade máxima (segundos) da análise mostrada no painel. Cada presença
+# muda a versão do registro, e montar a matriz custa dezenas de ms com
+# milhares de pessoas: refazer a cada atualização do painel não compensa.
+IDADE_MAXIMA = 30
+
+_cache = {}  # id(registro) -> (versão, momento, análise)
+_montando = set()
+_trava_cache = threading.Lock()
+
+
+def _montar(registro):
+    chave = id(registro)
+    try:
+        versao = registro.versao
+        analise = Analise(registro.pessoas())
+        with _trava_cache:
+            _cache[chave] = (versao, time.monotonic(), analise)
+        return analise
+    finally:
+        with _trava_cache:
+            _montando.discard(chave)
+
+
+def analise_atual(registro, idade_maxima=IDADE_MAXIMA):
+    # Reaproveita a análise enquanto o registro não mudar ou, se mudou, por
+    # até `idade_maxima` segundos. Depois disso devolve a antiga mesmo assim
+    # e monta a nova em outra thread. Com idade_maxima=0 a análise é sempre
+    # a da versão atual (a exportação precisa bater com o arquivo).
+    chave = id(registro)
+    versao = registro.versao
+    with _trava_cache:
+        guardada = _cache.get(chave)
+        if guardada is not None:
+            versao_guardada, momento, analise = guardada
+            if versao_guardada == versao or time.monotonic() - momento < idade_maxima:
+                return analise
+            if idade_maxima:
+                if chave not in _montando:
+                    _montando.add(chave)
+                    threading.Thread(target=_montar, args=(registro,), daemon=True).start()
+                return analise
+    return _montar(registro)
@@ -1,13 +1,22 @@
-from flask import Flask, request, jsonify, render_template, redirect, url_for, send_file, send_from_directory, render_template_string
+from flask import Flask, Response, request, jsonify, render_template, redirect, url_for, send_file, send_from_directory, render_template_string, stream_with_context
 from threading import Thread
 import os
-import time
 import csv
+import json
+import zipfile
 from templates.util import get_next_14_days, obter_data_do_sorteio
+from registro import Registro, MARCADA, JA_MARCADA
+from arquivos import escrita_atomica, travado
+from ativos import Ativos
+from banco import RegistroSQLite
+from analise import analise_atual
+from exportacao import ExportacaoExcel
+from eventos import Canal
+from importacao import importar, ler_planilha
+from metricas import Metricas
+from collections import Counter
 from datetime import datetime
-import random
 import pytz
-import pandas as pd
 from zoneinfo import ZoneInfo
 
 #manaus = pytz.timezone("America/Manaus") 
@@ -22,16 +31,40 @@ print(next_14_days)
 
 app = Flask(__name__)
 
+# Duração, erros e E/S por endpoint em /metrics (formato do Prometheus)
+metricas = Metricas()
+metricas.instalar(app)
+
+# Static com o hash do conteúdo na URL: nos templates, {{ ativo('arquivo') }}
+ativos = Ativos(app.static_folder, 'static')
+app.view_functions['static'] = ativos.servir
+app.add_template_global(ativos.url, 'ativo')
+
+# MISSAO_ARMAZENAMENTO=sqlite usa o banco SQLite (importe os CSVs antes com
+# `python banco.py`); o padrão continua sendo o dados.csv.
+if os.environ.get('MISSAO_ARMAZENAMENTO') == 'sqlite':
+  registro = RegistroSQLite(os.environ.get('MISSAO_BANCO', 'missaocalebe.db'))
+
+  @app.teardown_appcontext
+  def fechar_registro(erro):
+    # Cada thread/greenlet abre a sua conexão; com o gevent cada requisição
+    # é um greenlet novo, então a conexão é fechada ao fim dela
+    registro.fechar()
+else:
+  registro = Registro('dados.csv', 'presencas.csv', 'sorteio')
+  registro.compactar_periodicamente()
+# Tempo gasto no registro conta como E/S da requisição
+registro = metricas.instrumentar(
+  registro, 'db' if isinstance(registro, RegistroSQLite) else 'arquivo')
+
+exportacao = ExportacaoExcel(registro, next_14_days, 'cache')
+
 def now():
   now = str(datetime.now(ZoneInfo("America/Manaus")).strftime("%d-%m-%Y")).split(" ")[0]
 
   return now
 
-def obter_nome_arquivo_csv(dia):
-  pasta_sorteio = "sorteio"
-  nome_arquivo = f"{dia}.csv"
-  caminho_arquivo = os.path.join(pasta_sorteio, nome_arquivo)
-  return caminho_arquivo
+canal = Canal(now, 'eventos')
 
 @app.route('/list_files', defaults={'req_path': ''})
 @app.route('/list_files/<path:req_path>')
@@ -63,7 +96,9 @@ def edit_file(file_path):
 
     if request.method == 'POST':
         content = request.form['content']
-        with open(abs_path, 'w') as file:
+        # Mesma trava usada pelo registro: um cadastro concorrente não se
+        # perde nem deixa o arquivo pela metade
+        with travado(abs_path), escrita_atomica(abs_path, newline=None) as file:
             file.write(content)
         return jsonify({"message": "Arquivo salvo com sucesso"})
 
@@ -96,106 +131,83 @@ def add():
 
 @app.route('/realizar_sorteio', methods=['POST'])
 def realizar_sorteio():
-  data = request.get_json()
-  time.sleep(2)
-  quantidade_sorteados = int(data['quantidadeSorteados'])
+  data = request.get_json(silent=True)
+  try:
+    quantidade_sorteados = int(data['quantidadeSorteados'])
+  except (KeyError, TypeError, ValueError):
+    quantidade_sorteados = 0
+  if quantidade_sorteados < 1:
+    return {'success': False,
+            'message': 'Informe uma quantidade de sorteados maior que zero.'}, 400
   hoje = now().replace("/", "-")
 
-  # Ler o arquivo CSV correspondente ao dia do sorteio
-  nome_arquivo = obter_nome_arquivo_csv(hoje)
-
-  with open(nome_arquivo, 'r') as arquivo_csv:
-    registros = list(csv.reader(arquivo_csv))
-    participantes_presentes = [
-      registro[1] for registro in registros if registro[2] == '0'
-    ]
-
-    if quantidade_sorteados > len(participantes_presentes):
-      return {
-        'success':
-        False,
-        'message':
-        'Não há participantes suficientes para sortear a quantidade desejada.'
-      }
-
-    ganhadores = random.sample(participantes_presentes, quantidade_sorteados)
+  sorteados = registro.sortear(hoje, quantidade_sorteados)
+  if sorteados is None:
+    return {
+      'success':
+      False,
+      'message':
+      'Não há participantes suficientes para sortear a quantidade desejada.'
+    }
 
-    # Atualizar o arquivo CSV com o status dos ganhadores
-    for registro in registros:
-      if registro[1] in ganhadores:
-        registro[2] = '1'
-
-    with open(nome_arquivo, 'w', newline='') as arquivo_csv_atualizado:
-      writer = csv.writer(arquivo_csv_atualizado)
-      writer.writerows(registros)
-
-    return {'success': True, 'ganhadores': ganhadores}
+  canal.publicar('sorteio', {'sorteados': sorteados})
+  return {
+    'success': True,
+    'ganhadores': [sorteado['nome'] for sorteado in sorteados],
+    'sorteados': sorteados
+  }
 
 
 @app.route('/sorteio')
 def sorteio():
   hoje = now().replace("/", "-")
-  pessoas_presentes = []
-
-  # Ler o arquivo CSV correspondente ao dia do sorteio
-  nome_arquivo = obter_nome_arquivo_csv(hoje)
-  print(f"Nome do arquivo: {nome_arquivo}")  # Debug
-
-  if os.path.isfile(nome_arquivo):
-    print("Arquivo encontrado.")  # Debug
-
-    with open(nome_arquivo, 'r') as arquivo_csv:
-      leitor_csv = csv.reader(arquivo_csv)
-      for linha in leitor_csv:
-        nome = linha[1]
-        id = linha[0]
-        status = linha[2]
-        if status == '0':  # Verificar se o status é '0'
-          pessoas_presentes.append({'nome': nome, 'id': id})
-  else:
-    print("Arquivo não encontrado.")  # Debug
+  pessoas_presentes = registro.elegiveis_sorteio(hoje)
 
   return render_template('sorteio.html',
                          pessoas_presentes=pessoas_presentes,
                          now=now())
 
 
+@app.route('/compactar', methods=['POST'])
+def compactar():
+  entradas = registro.compactar()
+  return {'success': True, 'entradas': entradas}
+
+
 @app.route('/criar_excel')
 def criar_excel():
-  df = pd.read_csv('dados.csv')
-  df.to_excel('indicadores.xlsx', index=False)
+  return send_file(exportacao.caminho(), as_attachment=True,
+                   download_name='indicadores.xlsx')
 
-  return send_file('indicadores.xlsx', as_attachment=True)
+
+@app.route('/exportar_csv')
+def exportar_csv():
+  return send_file(registro.exportar_csv(), as_attachment=True,
+                   download_name='dados.csv')
 
 
 @app.route('/indicadores')
 def indicadores():
-  with open('dados.csv', 'r') as arquivo_csv:
-    registros = list(csv.reader(arquivo_csv))
-    indicadores = []
-    como_soube_data = {'convite': 0, 'propaganda': 0, 'banner': 0, 'outro': 0}
-
-    for i in range(9, len(next_14_days) + 9):
-      pessoas_presentes = [
-        registro[1] for registro in registros
-        if len(registro) > i and registro[i] == '1' and registro[1] != ''
-      ]
-      quantidade_presentes = len(pessoas_presentes)
-      variacao = quantidade_presentes - sum(
-        1 for registro in registros if len(registro) > i -
-        1 and registro[i - 1] == '1' and registro[1] != '')
-      indicadores.append((next_14_days[i - 9], quantidade_presentes, variacao,
-                          pessoas_presentes))
-    for registro in registros:
-      if registro[0] != 'id':
-        como_soube = registro[8]
-        como_soube_data[como_soube] += 1
+  resumo = registro.resumo()
+  indicadores = []
+  como_soube_data = {'convite': 0, 'propaganda': 0, 'banner': 0, 'outro': 0}
+  como_soube_data.update(resumo['como_soube'])
+
+  quantidade_anterior = 0
+  for dia, data in enumerate(next_14_days, start=1):
+    quantidade_presentes = resumo['presentes_por_dia'].get(dia, 0)
+    variacao = quantidade_presentes - quantidade_anterior
+    indicadores.append((data, quantidade_presentes, variacao))
+    quantidade_anterior = quantidade_presentes
+
+  analise = analise_atual(registro)
 
   return render_template('indicadores.html',
                          indicadores=indicadores,
                          como_soube_data=como_soube_data,
-                         registros=registros,
-                         quantidade_presentes = len(registros)-1,
+                         quantidade_presentes = resumo['total'],
+                         retencao=analise.retencao().to_dict('records'),
+                         bairros=analise.por_bairro().head(10).to_dict('records'),
                          criar_excel_url="/criar_excel")
 
 
@@ -211,101 +223,159 @@ def add_person():
   como_soube = request.form.get('como_soube')  # Adicionado
 
   if nome and idade and cep and rua and casa and telefone:
-    with open('dados.csv', 'r') as arquivo_csv:
-      reader = csv.reader(arquivo_csv)
-      next(reader)  # Pular a primeira linha (cabeçalho)
-
-      try:
-        ultimo_id = max(int(row[0]) for row in reader)
-        novo_id = ultimo_id + 1
-      except ValueError:
-        novo_id = 1
-
-    with open('dados.csv', 'a', newline='') as arquivo_csv:
-      writer = csv.writer(arquivo_csv)
-      dados = [
-        novo_id, nome, idade, cep, rua, bairro, casa, telefone, como_soube
-      ] + [''] * 14  # Atualizado
-      writer.writerow(dados)
+    novo_id = registro.adicionar(
+      [nome, idade, cep, rua, bairro, casa, telefone, como_soube])
+    exportacao.agendar()
+    canal.publicar('cadastro', {'id': str(novo_id), 'nome': nome,
+                                'como_soube': como_soube})
 
   return redirect(url_for('index'))
 
 
-def obter_nome_pessoa(pessoa_id):
-  with open('dados.csv', 'r') as arquivo_csv:
-    registros = list(csv.reader(arquivo_csv))
-    for registro in registros:
-      if registro[0] == str(pessoa_id):
-        return registro[1]
-  return None
-
-
-presenca_dia = {}
+@app.route('/importar', methods=['POST'])
+def importar_pessoas():
+  # Recebe uma planilha (CSV ou XLSX) no campo "arquivo" e responde com uma
+  # linha JSON de progresso a cada lote; a última traz o resumo. Com
+  # simular=1 só valida.
+  arquivo = request.files.get('arquivo')
+  if arquivo is None or not arquivo.filename:
+    return jsonify({'success': False, 'message': 'Envie a planilha no campo "arquivo".'}), 400
+  simular = request.form.get('simular') == '1'
+  linhas = ler_planilha(arquivo.stream, arquivo.filename,
+                        request.form.get('codificacao', 'utf-8-sig'))
+
+  def gerar():
+    try:
+      for progresso in importar(registro, linhas, simular):
+        cadastros = progresso.pop('cadastros', None)
+        if progresso.get('importadas'):
+          exportacao.agendar()
+          # Um evento só para a importação inteira: milhares de eventos de
+          # cadastro passariam do que o canal guarda para as telas
+          canal.publicar('importacao', {
+            'importadas': progresso['importadas'],
+            'como_soube': Counter(cadastro[7] for cadastro in cadastros)})
+        yield json.dumps(progresso, ensure_ascii=False) + '\n'
+    except (ValueError, csv.Error, zipfile.BadZipFile) as erro:
+      yield json.dumps({'concluido': True, 'erro': str(erro)}, ensure_ascii=False) + '\n'
+
+  return Response(stream_with_context(gerar()), mimetype='application/x-ndjson')
+
+
+def dia_de_hoje():
+  # Índice (1 a 16) de hoje na campanha, ou None fora dela
+  hoje = now()
+  return next_14_days.index(hoje) + 1 if hoje in next_14_days else None
+
+
+def registrar_presencas(itens):
+  # Marca as presenças, inscreve no sorteio do dia e avisa as telas
+  # conectadas, com uma escrita de cada tipo para o lote inteiro. Só a
+  # presença de hoje inscreve no sorteio: uma marcação que ficou na fila do
+  # tablet desde ontem não entra no sorteio de hoje.
+  resultados = registro.marcar_presencas(itens)
+  hoje = now().replace("/", "-")
+  indice_hoje = dia_de_hoje()
+
+  marcadas = []
+  for (pessoa_id, dia), resultado in zip(itens, resultados):
+    if resultado in (MARCADA, JA_MARCADA):
+      marcadas.append((registro.obter(pessoa_id), dia, resultado == MARCADA))
+
+  a_inscrever = [pessoa for pessoa, dia, _ in marcadas if dia == indice_hoje]
+  inscritos = set()
+  if a_inscrever:
+    novas = registro.inscrever_sorteio_varios(
+      hoje, [(pessoa['id'], pessoa['nome']) for pessoa in a_inscrever])
+    inscritos = {pessoa['id'] for pessoa, nova in zip(a_inscrever, novas) if nova}
+
+  eventos = []
+  for pessoa, dia, nova in marcadas:
+    inscrito = dia == indice_hoje and pessoa['id'] in inscritos
+    inscritos.discard(pessoa['id'])
+    if nova or inscrito:
+      eventos.append(('presenca', {'id': pessoa['id'], 'nome': pessoa['nome'],
+                                   'dia': dia, 'nova': nova, 'inscrito': inscrito}))
+  if eventos:
+    canal.publicar_varios(eventos)
+    exportacao.agendar()
+  return resultados
 
 
 @app.route('/marcar_presenca', methods=['POST'])
 def marcar_presenca():
-  data = request.get_json()
-  pessoa_id = data['pessoa_id']
-  dia = data['dia']
-
-  nome = obter_nome_pessoa(pessoa_id)
-  if nome is None:
+  data = request.get_json(silent=True)
+  try:
+    pessoa_id = int(data['pessoa_id'])
+    dia = int(data['dia'])
+  except (KeyError, TypeError, ValueError):
+    return {'success': False, 'message': 'Informe pessoa_id e dia.'}, 400
+
+  if registro.obter(pessoa_id) is None:
     return {'success': False, 'message': 'Pessoa não encontrada.'}
 
-  data_sorteio = now()
-  if data_sorteio is None:
-    return {'success': False, 'message': 'Data do sorteio não encontrada.'}
-
-  with open('dados.csv', 'r') as arquivo_csv:
-    registros = list(csv.reader(arquivo_csv))
-    if any(registro[0] == str(pessoa_id) for registro in registros):
-      for registro in registros:
-        if registro[0] == str(pessoa_id):
-          while len(registro) < dia + 9:
-            registro.append('')
-          registro[dia + 8] = '1'
-
-          break
-
-      with open('dados.csv', 'w', newline='') as arquivo_csv_atualizado:
-        writer = csv.writer(arquivo_csv_atualizado)
-        writer.writerows(registros)
-
-      # Atualiza o dicionário de presença por dia
-      data_str = f'{dia:02d}-' + str(datetime.today().strftime('%d-%m-%Y')[3:])
-
-      if data_str not in presenca_dia:
-        presenca_dia[data_str] = []
-      if pessoa_id not in presenca_dia[data_str]:
-        presenca_dia[data_str].append(pessoa_id)
-
-        # Escreve no arquivo de sorteio
-        nome_arquivo = f'sorteio/{data_sorteio.replace("/", "-")}.csv'
-        with open(nome_arquivo, 'a', newline='') as arquivo_sorteio:
-          writer = csv.writer(arquivo_sorteio)
-          writer.writerow([pessoa_id, nome,
-                           "0"])  # Inicializa o status como '0'
-
-      return {'success': True}
-    else:
-      return {'success': False}
+  resultado = registrar_presencas([(pessoa_id, dia)])[0]
+  return {'success': resultado in (MARCADA, JA_MARCADA)}
+
+
+@app.route('/marcar_presencas', methods=['POST'])
+def marcar_presencas():
+  # Lote de {pessoa_id, dia} enviado pelas telas de entrada, inclusive o que
+  # ficou na fila enquanto estavam sem internet. Repetir um item não tem
+  # efeito, então o lote pode ser reenviado com segurança.
+  data = request.get_json(silent=True)
+  itens = data.get('presencas') if isinstance(data, dict) else data
+  if not isinstance(itens, list) or len(itens) > 1000:
+    return {'success': False,
+            'message': 'Envie uma lista "presencas" com até 1000 itens.'}, 400
+
+  validos = []
+  for item in itens:
+    try:
+      validos.append((int(item['pessoa_id']), int(item['dia'])))
+    except (KeyError, TypeError, ValueError):
+      validos.append(None)
+
+  resultados = iter(registrar_presencas([item for item in validos if item]))
+  respostas = []
+  for item in validos:
+    resultado = next(resultados) if item else 'invalida'
+    respostas.append({
+      'pessoa_id': item[0] if item else None,
+      'dia': item[1] if item else None,
+      'success': resultado in (MARCADA, JA_MARCADA),
+      'status': resultado
+    })
+
+  return {'success': True, 'resultados': respostas}
+
+
+@app.route('/eventos')
+def eventos():
+  # Com gunicorn -k gevent a conexão fica aberta; com os outros workers cada
+  # requisição só entrega os eventos pendentes e o navegador volta em 3 s
+  return Response(canal.escutar(request.headers.get('Last-Event-ID')),
+                  mimetype='text/event-stream',
+                  headers={'Cache-Control': 'no-cache',
+                           'X-Accel-Buffering': 'no'})
 
 
 @app.route('/letter/<selected_letter>')
 def letter(selected_letter):
-  pessoas_com_selected_letter = []
-  with open('dados.csv', 'r') as arquivo_csv:
-    reader = csv.DictReader(arquivo_csv)
-    for row in reader:
-      if 'nome' in row and row['nome'].startswith(selected_letter):
-        pessoas_com_selected_letter.append(row)
+  por_pagina = 50
+  pagina = max(request.args.get('pagina', 1, type=int), 1)
+  pessoas_com_selected_letter, total = registro.por_prefixo(
+    selected_letter, (pagina - 1) * por_pagina, por_pagina)
+  total_paginas = max((total + por_pagina - 1) // por_pagina, 1)
 
   #next_14_days = get_next_14_days(now)
 
   return render_template('letter.html',
                          selected_letter=selected_letter,
                          pessoas=pessoas_com_selected_letter,
+                         total=total,
+                         pagina=pagina,
+                         total_paginas=total_paginas,
                          next_14_days=next_14_days,
                         now=now())
 
@@ -0,0 +1,205 @@
+import contextlib
+import csv
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos
+    fcntl = None
+
+
+@contextlib.contextmanager
+def travar_aberto(arquivo, compartilhado=False):
+    # Trava (flock) um arquivo já aberto, entre threads e processos
+    if fcntl is not None:
+        fcntl.flock(arquivo, fcntl.LOCK_SH if compartilhado else fcntl.LOCK_EX)
+    try:
+        yield arquivo
+    finally:
+        if fcntl is not None:
+            if not arquivo.closed and arquivo.writable():
+                arquivo.flush()
+            fcntl.flock(arquivo, fcntl.LOCK_UN)
+
+
+_seguradas = threading.local()
+
+
+@contextlib.contextmanager
+def travado(caminho, compartilhado=False):
+    # Trava consultiva em <caminho>.lock. Fica em um arquivo à parte porque
+    # o próprio arquivo pode ser substituído por os.replace enquanto isso.
+    # É reentrante na mesma thread: o flock é por descritor, e travar de novo
+    # o mesmo arquivo por outro descritor travaria a própria thread.
+    chave = os.path.abspath(caminho)
+    seguradas = _seguradas.__dict__.setdefault('travas', set())
+    if chave in seguradas:
+        yield
+        return
+    with open(caminho + '.lock', 'a') as trava:
+        with travar_aberto(trava, compartilhado):
+            seguradas.add(chave)
+            try:
+                yield
+            finally:
+                seguradas.discard(chave)
+
+
+@contextlib.contextmanager
+def escrita_atomica(caminho, newline='', sincronizar=True, modo='w'):
+    # Escreve em um temporário no mesmo diretório e só substitui o destino
+    # depois de tudo gravado em disco. Um erro no meio deixa o arquivo
+    # original intacto. Sem `sincronizar`, a troca continua atômica mas
+    # pode não sobreviver a uma queda de energia.
+    diretorio = os.path.dirname(os.path.abspath(caminho))
+    descritor, temporario = tempfile.mkstemp(dir=diretorio, prefix='.tmp-')
+    try:
+        opcoes = {} if 'b' in modo else {'newline': newline}
+        with os.fdopen(descritor, modo, **opcoes) as arquivo:
+            yield arquivo
+            arquivo.flush()
+            if sincronizar:
+                os.fsync(arquivo.fileno())
+        # mkstemp cria com 0600; mantém as permissões de quem já existia
+        if os.path.exists(caminho):
+            os.chmod(temporario, os.stat(caminho).st_mode & 0o777)
+        else:
+            os.chmod(temporario, 0o644)
+        os.replace(temporario, caminho)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(temporario)
+        raise
+
+
+class Cauda:
+    # Leitura incremental de um arquivo que só cresce por append ou é
+    # trocado inteiro por os.replace. O arquivo lido fica aberto: enquanto
+    # isso o inode não pode ser reaproveitado pelo sistema, então comparar o
+    # inode com o do caminho detecta a troca com segurança.
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.posicao = 0
+        self._arquivo = None
+        self._pid = None
+
+    def fechar(self):
+        if self._arquivo is not None:
+            self._arquivo.close()
+        self._arquivo, self._pid, self.posicao = None, None, 0
+
+    def reabrir(self):
+        # Depois de trocar o arquivo por um que já está todo em memória
+        self.fechar()
+        self._abrir()
+        if self._arquivo is not None:
+            self.posicao = os.fstat(self._arquivo.fileno()).st_size
+
+    def _abrir(self):
+        try:
+            self._arquivo = open(self.caminho, 'rb')
+        except FileNotFoundError:
+            return
+        self._pid = os.getpid()
+
+    def trocado(self):
+        # True se o arquivo lido até aqui foi substituído, truncado ou apagado
+        if self._arquivo is None:
+            return False
+        try:
+            info = os.stat(self.caminho)
+        except FileNotFoundError:
+            return True
+        lido = os.fstat(self._arquivo.fileno())
+        if (info.st_dev, info.st_ino) != (lido.st_dev, lido.st_ino):
+            return True
+        if lido.st_size < self.posicao:
+            return True  # Truncado no lugar
+        if self._pid != os.getpid():
+            # Depois de um fork o descritor (e a posição) seria compartilhado
+            self._arquivo.close()
+            self._abrir()
+        return False
+
+    def estado(self):
+        if self._arquivo is None:
+            return 0, 0
+        info = os.fstat(self._arquivo.fileno())
+        return info.st_mtime_ns, info.st_size
+
+    def linhas(self):
+        # Linhas completas acrescentadas desde a última leitura, já
+        # separadas pelo csv. Uma linha sem '\n' ainda está sendo gravada e
+        # fica para a próxima.
+        if self._arquivo is None:
+            self._abrir()
+            if self._arquivo is None:
+                return []
+        if os.fstat(self._arquivo.fileno()).st_size <= self.posicao:
+            return []
+        self._arquivo.seek(self.posicao)
+        linhas = []
+        for bruta in iter(self._arquivo.readline, b''):
+            if not bruta.endswith(b'\n'):
+                break
+            self.posicao += len(bruta)
+            linhas.extend(csv.reader([bruta.decode('utf-8')]))
+        return linhas
+
+
+class Sincronizador:
+    # Agrupa os fsync dos arquivos que só recebem append: cada escrita marca
+    # o arquivo e uma thread faz um único fsync por arquivo a cada
+    # `intervalo` segundos. Uma queda de energia perde no máximo esse
+    # intervalo; uma queda do processo não perde nada.
+
+    def __init__(self, intervalo=1.0):
+        self.intervalo = intervalo
+        self._pendentes = set()
+        self._condicao = threading.Condition()
+        self._thread = None
+
+    def marcar(self, caminho):
+        with self._condicao:
+            self._pendentes.add(caminho)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._executar, daemon=True)
+                self._thread.start()
+            self._condicao.notify()
+
+    def sincronizar(self):
+        with self._condicao:
+            pendentes, self._pendentes = self._pendentes, set()
+        for caminho in pendentes:
+            try:
+                with open(caminho, 'rb') as arquivo:
+                    os.fsync(arquivo.fileno())
+            except FileNotFoundError:
+                pass
+
+    def _executar(self):
+        while True:
+            with self._condicao:
+                while not self._pendentes:
+                    self._condicao.wait()
+            time.sleep(self.intervalo)
+            self.sincronizar()
+
+
+sincronizador = Sincronizador()
+
+
+def anexar(caminho, texto, sincronizar=False):
+    # Acrescenta o texto com uma única escrita, sob a trava do arquivo
+    with travado(caminho):
+        with open(caminho, 'a', newline='') as arquivo:
+            arquivo.write(texto)
+            arquivo.flush()
+            if sincronizar:
+                os.fsync(arquivo.fileno())
+    if not sincronizar:
+        sincronizador.marcar(caminho)
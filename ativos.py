@@ -0,0 +1,121 @@
+import argparse
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+
+from flask import request, send_from_directory, url_for
+from werkzeug.security import safe_join
+
+from arquivos import escrita_atomica
+
+# Só vale a pena comprimir texto; imagens já vêm comprimidas
+EXTENSOES_TEXTO = {'.css', '.js', '.mjs', '.json', '.map', '.svg', '.txt', '.html', '.xml'}
+CACHE_IMUTAVEL = 'public, max-age=31536000, immutable'
+CACHE_REVALIDAR = 'public, no-cache'
+
+
+class Ativos:
+    # Arquivos de uma pasta servidos com a impressão digital do conteúdo na
+    # URL (?v=<hash>). Quando o `v` pedido é o do arquivo atual a resposta
+    # pode ficar um ano no cache do navegador (immutable): se o arquivo
+    # mudar, a URL gerada por url() também muda. Sem `v`, ou com um `v`
+    # antigo, o navegador revalida pelo ETag. Range e If-Modified-Since vêm
+    # do send_file.
+
+    def __init__(self, pasta, endpoint):
+        self.pasta = os.path.abspath(pasta)
+        self.endpoint = endpoint
+        self._hashes = {}  # nome -> (mtime, tamanho, hash)
+        self._trava = threading.Lock()
+
+    def hash(self, nome):
+        # Recalculado só quando mtime ou tamanho mudam
+        caminho = safe_join(self.pasta, nome)
+        if caminho is None:
+            return None
+        try:
+            info = os.stat(caminho)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        guardado = self._hashes.get(nome)
+        if guardado is not None and guardado[:2] == (info.st_mtime_ns, info.st_size):
+            return guardado[2]
+        resumo = hashlib.sha256()
+        with open(caminho, 'rb') as arquivo:
+            for bloco in iter(lambda: arquivo.read(1 << 16), b''):
+                resumo.update(bloco)
+        valor = resumo.hexdigest()[:12]
+        with self._trava:
+            self._hashes[nome] = (info.st_mtime_ns, info.st_size, valor)
+        return valor
+
+    def url(self, nome, **valores):
+        # Para os templates, no lugar de url_for(endpoint, filename=nome)
+        return url_for(self.endpoint, filename=nome, v=self.hash(nome), **valores)
+
+    def _comprimido(self, nome):
+        # <nome>.gz gerado por precomprimir(), se o cliente aceitar gzip e o
+        # .gz não for mais velho que o original
+        if os.path.splitext(nome)[1].lower() not in EXTENSOES_TEXTO:
+            return None
+        if not request.accept_encodings['gzip']:
+            return None
+        original = safe_join(self.pasta, nome)
+        try:
+            if os.stat(original + '.gz').st_mtime_ns >= os.stat(original).st_mtime_ns:
+                return nome + '.gz'
+        except (FileNotFoundError, NotADirectoryError, TypeError):
+            pass
+        return None
+
+    def servir(self, filename):
+        # View no lugar de send_from_directory (mesmo nome de parâmetro da
+        # view 'static' do Flask)
+        atual = self.hash(filename)
+        comprimido = self._comprimido(filename) if atual else None
+        resposta = send_from_directory(
+            self.pasta, comprimido or filename, conditional=True,
+            etag=f'{atual}-gzip' if comprimido else (atual or True),
+            mimetype=mimetypes.guess_type(filename)[0])
+        if comprimido:
+            resposta.headers['Content-Encoding'] = 'gzip'
+        resposta.vary.add('Accept-Encoding')
+        if atual and request.args.get('v') == atual:
+            resposta.headers['Cache-Control'] = CACHE_IMUTAVEL
+        else:
+            resposta.headers['Cache-Control'] = CACHE_REVALIDAR
+        return resposta
+
+
+def precomprimir(pasta, nivel=9):
+    # Grava <arquivo>.gz ao lado de cada arquivo de texto que ainda não tem
+    # um .gz atualizado. Retorna quantos foram gerados.
+    gerados = 0
+    for raiz, _, nomes in os.walk(pasta):
+        for nome in nomes:
+            if os.path.splitext(nome)[1].lower() not in EXTENSOES_TEXTO:
+                continue
+            caminho = os.path.join(raiz, nome)
+            destino = caminho + '.gz'
+            if os.path.exists(destino) and os.stat(destino).st_mtime_ns >= os.stat(caminho).st_mtime_ns:
+                continue
+            with open(caminho, 'rb') as arquivo:
+                dados = arquivo.read()
+            comprimido = gzip.compress(dados, nivel, mtime=0)
+            if len(comprimido) >= len(dados):
+                continue
+            with escrita_atomica(destino, modo='wb', sincronizar=False) as arquivo:
+                arquivo.write(comprimido)
+            gerados += 1
+    return gerados
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Gera as versões .gz dos arquivos de texto de uma pasta.')
+    parser.add_argument('pastas', nargs='+')
+    args = parser.parse_args()
+    for pasta in args.pastas:
+        print(f'{pasta}: {precomprimir(pasta)} arquivos comprimidos')
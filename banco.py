@@ -0,0 +1,404 @@
+import argparse
+import contextlib
+import csv
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from arquivos import escrita_atomica
+from registro import (COLUNAS, DIA_INVALIDO, JA_MARCADA, MARCADA, NAO_ENCONTRADA,
+                      TOTAL_DIAS, normalizar_nome)
+
+ESQUEMA = '''
+CREATE TABLE IF NOT EXISTS pessoas (
+    id INTEGER PRIMARY KEY,
+    nome TEXT NOT NULL,
+    idade TEXT,
+    cep TEXT,
+    rua TEXT,
+    bairro TEXT,
+    casa TEXT,
+    telefone TEXT,
+    como_soube TEXT,
+    nome_busca TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_pessoas_nome ON pessoas (nome);
+CREATE INDEX IF NOT EXISTS idx_pessoas_como_soube ON pessoas (como_soube);
+
+CREATE TABLE IF NOT EXISTS presencas (
+    pessoa_id INTEGER NOT NULL REFERENCES pessoas (id),
+    dia INTEGER NOT NULL,
+    marcado_em TEXT,
+    PRIMARY KEY (pessoa_id, dia)
+);
+CREATE INDEX IF NOT EXISTS idx_presencas_dia ON presencas (dia, pessoa_id);
+
+CREATE TABLE IF NOT EXISTS sorteio (
+    data TEXT NOT NULL,
+    pessoa_id INTEGER NOT NULL,
+    nome TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT '0',
+    PRIMARY KEY (data, pessoa_id)
+);
+CREATE INDEX IF NOT EXISTS idx_sorteio_status ON sorteio (data, status);
+
+CREATE TABLE IF NOT EXISTS sequencias (
+    nome TEXT PRIMARY KEY,
+    valor INTEGER NOT NULL
+);
+'''
+
+CAMPOS_PESSOA = COLUNAS[1:9]
+
+
+class RegistroSQLite:
+    # Mesma interface do Registro (registro.py), guardando pessoas,
+    # presenças e sorteios em um banco SQLite com índices por id, nome e
+    # dia. O modo WAL permite leituras simultâneas durante as marcações.
+
+    def __init__(self, caminho='missaocalebe.db'):
+        self.caminho = caminho
+        self._local = threading.local()
+        self._conexao().executescript(ESQUEMA)
+        self._migrar()
+
+    def _migrar(self):
+        # Bancos criados antes da coluna nome_busca
+        conexao = self._conexao()
+        colunas = [linha['name'] for linha in conexao.execute('PRAGMA table_info(pessoas)')]
+        if 'nome_busca' not in colunas:
+            conexao.execute('ALTER TABLE pessoas ADD COLUMN nome_busca TEXT')
+        conexao.execute('CREATE INDEX IF NOT EXISTS idx_pessoas_nome_busca '
+                        'ON pessoas (nome_busca, id)')
+        pendentes = conexao.execute(
+            'SELECT id, nome FROM pessoas WHERE nome_busca IS NULL').fetchall()
+        if pendentes:
+            conexao.executemany(
+                'UPDATE pessoas SET nome_busca = ? WHERE id = ?',
+                [(normalizar_nome(linha['nome']), linha['id']) for linha in pendentes])
+
+    def _conexao(self):
+        conexao = getattr(self._local, 'conexao', None)
+        if conexao is None:
+            conexao = sqlite3.connect(self.caminho, timeout=30,
+                                      isolation_level=None)
+            conexao.row_factory = sqlite3.Row
+            conexao.execute('PRAGMA journal_mode=WAL')
+            conexao.execute('PRAGMA synchronous=NORMAL')
+            self._local.conexao = conexao
+        return conexao
+
+    def fechar(self):
+        # Fecha a conexão desta thread (ou greenlet). O app chama ao fim de
+        # cada requisição: com o gevent cada requisição é um greenlet novo e
+        # as conexões abertas nunca seriam reaproveitadas.
+        conexao = getattr(self._local, 'conexao', None)
+        if conexao is not None:
+            self._local.conexao = None
+            conexao.close()
+
+    @contextlib.contextmanager
+    def _transacao(self):
+        conexao = self._conexao()
+        conexao.execute('BEGIN IMMEDIATE')
+        try:
+            yield conexao
+        except BaseException:
+            conexao.execute('ROLLBACK')
+            raise
+        conexao.execute('COMMIT')
+
+    def _mudou(self, conexao):
+        # Na mesma transação de cada escrita em pessoas/presencas. Fica no
+        # banco, então todas as conexões (threads, greenlets, workers) veem
+        # o mesmo valor; PRAGMA data_version e total_changes são por conexão.
+        conexao.execute(
+            "INSERT INTO sequencias (nome, valor) VALUES ('versao', 1) "
+            'ON CONFLICT (nome) DO UPDATE SET valor = valor + 1')
+
+    @property
+    def versao(self):
+        linha = self._conexao().execute(
+            "SELECT valor FROM sequencias WHERE nome = 'versao'").fetchone()
+        return linha['valor'] if linha else 0
+
+    def assinatura(self):
+        # Identifica a versão dos dados em disco, igual para todos os processos
+        partes = []
+        for caminho in (self.caminho, self.caminho + '-wal'):
+            try:
+                info = os.stat(caminho)
+                partes += [info.st_mtime_ns, info.st_size]
+            except FileNotFoundError:
+                partes += [0, 0]
+        return '-'.join(str(parte) for parte in partes)
+
+    def _montar(self, linhas):
+        # Converte linhas de pessoas para o formato de dicionário do dados.csv
+        linhas = list(linhas)
+        if not linhas:
+            return []
+        ids = [linha['id'] for linha in linhas]
+        dias = {}
+        for i in range(0, len(ids), 500):
+            lote = ids[i:i + 500]
+            marcadores = ','.join('?' * len(lote))
+            for pessoa_id, dia in self._conexao().execute(
+                    f'SELECT pessoa_id, dia FROM presencas '
+                    f'WHERE pessoa_id IN ({marcadores})', lote):
+                dias.setdefault(pessoa_id, set()).add(dia)
+
+        pessoas = []
+        for linha in linhas:
+            pessoa = {'id': str(linha['id'])}
+            for campo in CAMPOS_PESSOA:
+                pessoa[campo] = linha[campo] if linha[campo] is not None else ''
+            presente = dias.get(linha['id'], ())
+            for dia in range(1, TOTAL_DIAS + 1):
+                pessoa[f'dia{dia}'] = '1' if dia in presente else ''
+            pessoas.append(pessoa)
+        return pessoas
+
+    def obter(self, pessoa_id):
+        try:
+            pessoa_id = int(pessoa_id)
+        except (TypeError, ValueError):
+            return None
+        pessoas = self._montar(self._conexao().execute(
+            'SELECT * FROM pessoas WHERE id = ?', (pessoa_id,)))
+        return pessoas[0] if pessoas else None
+
+    def nome(self, pessoa_id):
+        pessoa = self.obter(pessoa_id)
+        return pessoa['nome'] if pessoa else None
+
+    def buscar_por_nome(self, nome):
+        return self._montar(self._conexao().execute(
+            'SELECT * FROM pessoas WHERE nome = ? ORDER BY id', (nome,)))
+
+    def presentes(self, dia):
+        return self._montar(self._conexao().execute(
+            'SELECT p.* FROM presencas pr JOIN pessoas p ON p.id = pr.pessoa_id '
+            'WHERE pr.dia = ? ORDER BY p.id', (dia,)))
+
+    def por_prefixo(self, prefixo, inicio=0, limite=None):
+        # O intervalo [prefixo, prefixo + U+FFFF) usa o índice
+        # idx_pessoas_nome_busca. Retorna (página, total).
+        intervalo = (normalizar_nome(prefixo), normalizar_nome(prefixo) + '\uffff')
+        conexao = self._conexao()
+        total = conexao.execute(
+            'SELECT COUNT(*) FROM pessoas WHERE nome_busca >= ? AND nome_busca < ?',
+            intervalo).fetchone()[0]
+        pessoas = self._montar(conexao.execute(
+            'SELECT * FROM pessoas WHERE nome_busca >= ? AND nome_busca < ? '
+            'ORDER BY nome_busca, id LIMIT ? OFFSET ?',
+            intervalo + (-1 if limite is None else limite, inicio)))
+        return pessoas, total
+
+    def pessoas(self):
+        return self._montar(self._conexao().execute(
+            'SELECT * FROM pessoas ORDER BY id'))
+
+    def __len__(self):
+        return self._conexao().execute('SELECT COUNT(*) FROM pessoas').fetchone()[0]
+
+    def resumo(self):
+        # Contagens pelos índices idx_presencas_dia e idx_pessoas_como_soube
+        conexao = self._conexao()
+        return {
+            'total': len(self),
+            'presentes_por_dia': dict(conexao.execute(
+                'SELECT dia, COUNT(*) FROM presencas GROUP BY dia').fetchall()),
+            'como_soube': dict(conexao.execute(
+                "SELECT COALESCE(como_soube, ''), COUNT(*) FROM pessoas "
+                'GROUP BY como_soube').fetchall()),
+        }
+
+    def _alocar(self, conexao, quantidade):
+        # Dentro de uma transação. Como no Registro, a sequência nunca volta
+        # atrás e não reaproveita ids de pessoas apagadas.
+        linha = conexao.execute(
+            "SELECT valor FROM sequencias WHERE nome = 'pessoas'").fetchone()
+        ultimo = max(linha['valor'] if linha else 0, conexao.execute(
+            'SELECT COALESCE(MAX(id), 0) FROM pessoas').fetchone()[0])
+        conexao.execute(
+            "INSERT OR REPLACE INTO sequencias (nome, valor) VALUES ('pessoas', ?)",
+            (ultimo + quantidade,))
+        return range(ultimo + 1, ultimo + quantidade + 1)
+
+    def alocar_ids(self, quantidade):
+        with self._transacao() as conexao:
+            return self._alocar(conexao, quantidade)
+
+    def adicionar(self, campos):
+        return self.adicionar_varios([campos])[0]
+
+    def adicionar_varios(self, cadastros, ids=None):
+        # Todos os cadastros na mesma transação; retorna os ids
+        linhas = []
+        for campos in cadastros:
+            campos = ['' if campo is None else str(campo) for campo in campos]
+            campos += [''] * (len(CAMPOS_PESSOA) - len(campos))
+            linhas.append(campos[:len(CAMPOS_PESSOA)] + [normalizar_nome(campos[0])])
+        with self._transacao() as conexao:
+            if ids is None:
+                ids = self._alocar(conexao, len(linhas))
+            conexao.executemany(
+                f'INSERT INTO pessoas (id, {", ".join(CAMPOS_PESSOA)}, nome_busca) '
+                f'VALUES ({", ".join("?" * (len(CAMPOS_PESSOA) + 2))})',
+                [[novo_id] + campos for novo_id, campos in zip(ids, linhas)])
+            self._mudou(conexao)
+        return [int(novo_id) for novo_id in ids]
+
+    def marcar_presencas(self, itens):
+        # Marca vários pares (pessoa_id, dia) em uma única transação
+        horario = datetime.now().isoformat(timespec='seconds')
+        resultados = []
+        with self._transacao() as conexao:
+            for pessoa_id, dia in itens:
+                try:
+                    pessoa_id = int(pessoa_id)
+                except (TypeError, ValueError):
+                    resultados.append(NAO_ENCONTRADA)
+                    continue
+                if conexao.execute('SELECT 1 FROM pessoas WHERE id = ?',
+                                   (pessoa_id,)).fetchone() is None:
+                    resultados.append(NAO_ENCONTRADA)
+                elif not 1 <= dia <= TOTAL_DIAS:
+                    resultados.append(DIA_INVALIDO)
+                else:
+                    cursor = conexao.execute(
+                        'INSERT OR IGNORE INTO presencas (pessoa_id, dia, marcado_em) '
+                        'VALUES (?, ?, ?)', (pessoa_id, dia, horario))
+                    resultados.append(MARCADA if cursor.rowcount == 1 else JA_MARCADA)
+            if MARCADA in resultados:
+                self._mudou(conexao)
+        return resultados
+
+    def compactar(self):
+        self._conexao().execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        return 0
+
+    def exportar_csv(self):
+        # O arquivo só é trocado depois de completo: um download simultâneo
+        # recebe o anterior inteiro, nunca um pela metade
+        caminho = os.path.splitext(self.caminho)[0] + '.csv'
+        with escrita_atomica(caminho, sincronizar=False) as arquivo_csv:
+            writer = csv.writer(arquivo_csv)
+            writer.writerow(COLUNAS)
+            for pessoa in self.pessoas():
+                writer.writerow([pessoa[coluna] for coluna in COLUNAS])
+        return caminho
+
+    def inscrever_sorteio_varios(self, data, pessoas):
+        novas = []
+        with self._transacao() as conexao:
+            for pessoa_id, nome in pessoas:
+                cursor = conexao.execute(
+                    'INSERT OR IGNORE INTO sorteio (data, pessoa_id, nome, status) '
+                    "VALUES (?, ?, ?, '0')", (data, int(pessoa_id), nome))
+                novas.append(cursor.rowcount == 1)
+        return novas
+
+    def elegiveis_sorteio(self, data):
+        return [dict(linha) for linha in self._conexao().execute(
+            "SELECT CAST(pessoa_id AS TEXT) AS id, nome FROM sorteio "
+            "WHERE data = ? AND status = '0' "
+            'ORDER BY rowid', (data,))]
+
+    def sortear(self, data, quantidade):
+        # Sorteia e marca os ganhadores na mesma transação. Retorna a lista
+        # de {'id', 'nome'} ou None se não houver elegíveis suficientes.
+        if quantidade < 1:
+            # LIMIT -1 no SQLite é "sem limite": sortearia todo mundo
+            raise ValueError(f'quantidade de sorteados inválida: {quantidade}')
+        with self._transacao() as conexao:
+            ganhadores = conexao.execute(
+                "SELECT pessoa_id, nome FROM sorteio WHERE data = ? AND status = '0' "
+                'ORDER BY RANDOM() LIMIT ?', (data, quantidade)).fetchall()
+            if len(ganhadores) < quantidade:
+                return None
+            conexao.executemany(
+                "UPDATE sorteio SET status = '1' WHERE data = ? AND pessoa_id = ?",
+                [(data, ganhador['pessoa_id']) for ganhador in ganhadores])
+        return [{'id': str(ganhador['pessoa_id']), 'nome': ganhador['nome']}
+                for ganhador in ganhadores]
+
+
+def importar_csv(banco, dados='dados.csv', diario='presencas.csv',
+                 pasta_sorteio='sorteio'):
+    # Importa uma única vez o dados.csv, o diário de presenças e os
+    # arquivos de sorteio para o banco.
+    conexao = banco._conexao()
+    conexao.execute('BEGIN')
+    try:
+        pessoas = presencas = participantes = 0
+        with open(dados, 'r', newline='') as arquivo_csv:
+            reader = csv.reader(arquivo_csv)
+            next(reader, None)  # Pular o cabeçalho
+            for linha in reader:
+                if not linha or not linha[0].isdigit():
+                    continue
+                linha = (linha + [''] * len(COLUNAS))[:len(COLUNAS)]
+                conexao.execute(
+                    f'INSERT OR REPLACE INTO pessoas '
+                    f'(id, {", ".join(CAMPOS_PESSOA)}, nome_busca) '
+                    f'VALUES ({", ".join("?" * (len(CAMPOS_PESSOA) + 2))})',
+                    linha[:9] + [normalizar_nome(linha[1])])
+                pessoas += 1
+                for dia in range(1, TOTAL_DIAS + 1):
+                    if linha[8 + dia] == '1':
+                        conexao.execute(
+                            'INSERT OR IGNORE INTO presencas (pessoa_id, dia) '
+                            'VALUES (?, ?)', (int(linha[0]), dia))
+                        presencas += 1
+
+        if os.path.isfile(diario):
+            with open(diario, 'r', newline='') as arquivo_diario:
+                for linha in csv.reader(arquivo_diario):
+                    if len(linha) >= 2 and linha[0].isdigit() and linha[1].isdigit():
+                        conexao.execute(
+                            'INSERT OR IGNORE INTO presencas (pessoa_id, dia, marcado_em) '
+                            'VALUES (?, ?, ?)',
+                            (int(linha[0]), int(linha[1]),
+                             linha[2] if len(linha) > 2 else None))
+                        presencas += 1
+
+        if os.path.isdir(pasta_sorteio):
+            for nome_arquivo in sorted(os.listdir(pasta_sorteio)):
+                if not nome_arquivo.endswith('.csv'):
+                    continue
+                data = nome_arquivo[:-len('.csv')]
+                with open(os.path.join(pasta_sorteio, nome_arquivo), 'r',
+                          newline='') as arquivo_sorteio:
+                    for linha in csv.reader(arquivo_sorteio):
+                        if len(linha) >= 3 and linha[0].isdigit():
+                            # A última linha de cada pessoa define o status
+                            conexao.execute(
+                                'INSERT OR REPLACE INTO sorteio '
+                                '(data, pessoa_id, nome, status) VALUES (?, ?, ?, ?)',
+                                (data, int(linha[0]), linha[1], linha[2]))
+                            participantes += 1
+
+        banco._mudou(conexao)
+        conexao.execute('COMMIT')
+    except Exception:
+        conexao.execute('ROLLBACK')
+        raise
+    return pessoas, presencas, participantes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Importa os arquivos CSV da Missão Calebe para o SQLite.')
+    parser.add_argument('--banco', default='missaocalebe.db')
+    parser.add_argument('--dados', default='dados.csv')
+    parser.add_argument('--diario', default='presencas.csv')
+    parser.add_argument('--sorteio', default='sorteio')
+    args = parser.parse_args()
+
+    pessoas, presencas, participantes = importar_csv(
+        RegistroSQLite(args.banco), args.dados, args.diario, args.sorteio)
+    print(f'{pessoas} pessoas, {presencas} presenças e '
+          f'{participantes} participantes de sorteio importados em {args.banco}')
@@ -0,0 +1,267 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import random
+import string
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from metricas import percentil
+from registro import COLUNAS, TOTAL_DIAS
+
+# Teste de carga das rotas mais usadas nas noites de campanha. Gera um
+# dados.csv e um sorteio/<hoje>.csv sintéticos para cada tamanho, sobe o
+# app.py em um processo novo (ou usa um servidor já rodando, com --url) e
+# dispara a mistura de requisições em várias threads. Compara com um
+# resultado salvo antes e termina com erro se algum endpoint piorou.
+#
+#     python desempenho.py --salvar base.json
+#     python desempenho.py --comparar base.json
+#     python desempenho.py --tamanhos 1000 --armazenamento sqlite
+
+TAMANHOS = (1000, 10000, 100000)
+
+# endpoint -> peso na mistura: presenças em rajada, navegação por letra,
+# painel de indicadores atualizando e sorteios de vez em quando
+MISTURA = {'marcar_presenca': 50, 'letter': 30, 'indicadores': 15, 'realizar_sorteio': 5}
+
+NOMES = ['Ana', 'Antônio', 'Bruna', 'Carlos', 'Daniela', 'Eduardo', 'Francisca',
+         'Gabriel', 'Helena', 'Igor', 'Joana', 'José', 'Kátia', 'Lucas', 'Maria',
+         'Nilson', 'Otávio', 'Paula', 'Raimunda', 'Sérgio', 'Tatiane', 'Vitor', 'Zuleide']
+SOBRENOMES = ['Silva', 'Souza', 'Oliveira', 'Pereira', 'Costa', 'Ferreira',
+              'Almeida', 'Lima', 'Carvalho', 'Monteiro', 'Andrade', 'Pimentel']
+BAIRROS = ['Centro', 'Cidade Nova', 'Flores', 'Nova Cidade', 'Compensa',
+           'Alvorada', 'Japiim', 'Coroado', 'Tarumã', 'Aleixo']
+COMO_SOUBE = ['convite', 'propaganda', 'banner', 'outro']
+
+
+def hoje():
+    # Mesmo formato do now() do app.py
+    return datetime.now(ZoneInfo('America/Manaus')).strftime('%d-%m-%Y')
+
+
+def gerar_dados(pasta, pessoas, semente=1, inscritos=0.3):
+    # dados.csv com `pessoas` cadastros e presenças espalhadas pelos dias, e
+    # o sorteio de hoje com uma fração dos cadastrados inscrita
+    aleatorio = random.Random(semente)
+    os.makedirs(os.path.join(pasta, 'sorteio'), exist_ok=True)
+    nomes = {}
+    with open(os.path.join(pasta, 'dados.csv'), 'w', newline='') as arquivo:
+        escritor = csv.writer(arquivo)
+        escritor.writerow(COLUNAS)
+        for pessoa_id in range(1, pessoas + 1):
+            nome = f'{aleatorio.choice(NOMES)} {aleatorio.choice(SOBRENOMES)}'
+            nomes[pessoa_id] = nome
+            frequencia = aleatorio.random()
+            escritor.writerow(
+                [pessoa_id, nome, aleatorio.randint(10, 80), f'690{aleatorio.randint(0, 99999):05d}',
+                 'Rua ' + aleatorio.choice(SOBRENOMES), aleatorio.choice(BAIRROS),
+                 aleatorio.randint(1, 2000), f'929{aleatorio.randint(0, 99999999):08d}',
+                 aleatorio.choice(COMO_SOUBE)]
+                + ['1' if aleatorio.random() < frequencia else '' for _ in range(TOTAL_DIAS)])
+    open(os.path.join(pasta, 'presencas.csv'), 'w').close()
+    with open(os.path.join(pasta, 'sorteio', f'{hoje()}.csv'), 'w', newline='') as arquivo:
+        escritor = csv.writer(arquivo)
+        for pessoa_id in aleatorio.sample(range(1, pessoas + 1), int(pessoas * inscritos)):
+            escritor.writerow([pessoa_id, nomes[pessoa_id], '0'])
+
+
+def requisicao(aleatorio, pessoas):
+    # (endpoint, método, caminho, corpo json) sorteado conforme a MISTURA
+    endpoint = aleatorio.choices(list(MISTURA), weights=list(MISTURA.values()))[0]
+    if endpoint == 'marcar_presenca':
+        return endpoint, 'POST', '/marcar_presenca', {
+            'pessoa_id': aleatorio.randint(1, pessoas), 'dia': aleatorio.randint(1, TOTAL_DIAS)}
+    if endpoint == 'letter':
+        pagina = 1 if aleatorio.random() < 0.8 else aleatorio.randint(2, 5)
+        return endpoint, 'GET', f'/letter/{aleatorio.choice(string.ascii_uppercase)}?pagina={pagina}', None
+    if endpoint == 'indicadores':
+        return endpoint, 'GET', '/indicadores', None
+    return endpoint, 'POST', '/realizar_sorteio', {'quantidadeSorteados': 1}
+
+
+def _cliente_flask(app):
+    cliente = app.test_client()
+
+    def enviar(metodo, caminho, corpo):
+        resposta = cliente.open(caminho, method=metodo, json=corpo)
+        resposta.close()
+        return resposta.status_code
+    return enviar
+
+
+def _cliente_http(url):
+    def enviar(metodo, caminho, corpo):
+        dados = json.dumps(corpo).encode() if corpo is not None else None
+        pedido = urllib.request.Request(url.rstrip('/') + caminho, data=dados, method=metodo,
+                                        headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(pedido, timeout=60) as resposta:
+                resposta.read()
+                return resposta.status
+        except urllib.error.HTTPError as erro:
+            return erro.code
+    return enviar
+
+
+def disparar(novo_cliente, pessoas, requisicoes, threads, aquecimento, semente=1):
+    # Roda `requisicoes` requisições da mistura divididas entre `threads`,
+    # depois de `aquecimento` requisições não medidas (caches, imports)
+    aquecer = novo_cliente()
+    aleatorio = random.Random(semente)
+    for _ in range(aquecimento):
+        _, metodo, caminho, corpo = requisicao(aleatorio, pessoas)
+        aquecer(metodo, caminho, corpo)
+
+    amostras = []  # (endpoint, segundos, status)
+    trava = threading.Lock()
+
+    def trabalhar(indice, quantidade):
+        enviar = novo_cliente()
+        aleatorio = random.Random(semente * 1000 + indice)
+        medidas = []
+        for _ in range(quantidade):
+            endpoint, metodo, caminho, corpo = requisicao(aleatorio, pessoas)
+            inicio = time.perf_counter()
+            try:
+                status = enviar(metodo, caminho, corpo)
+            except Exception:
+                status = 599
+            medidas.append((endpoint, time.perf_counter() - inicio, status))
+        with trava:
+            amostras.extend(medidas)
+
+    partes = [requisicoes // threads + (1 if indice < requisicoes % threads else 0)
+              for indice in range(threads)]
+    trabalhadores = [threading.Thread(target=trabalhar, args=(indice, quantidade))
+                     for indice, quantidade in enumerate(partes)]
+    inicio = time.perf_counter()
+    for trabalhador in trabalhadores:
+        trabalhador.start()
+    for trabalhador in trabalhadores:
+        trabalhador.join()
+    return resumir(amostras, time.perf_counter() - inicio)
+
+
+def resumir(amostras, duracao):
+    por_endpoint = {}
+    for endpoint, segundos, status in amostras:
+        por_endpoint.setdefault(endpoint, []).append((segundos, status))
+    endpoints = {}
+    for endpoint, medidas in sorted(por_endpoint.items()):
+        tempos = sorted(segundos for segundos, _ in medidas)
+        endpoints[endpoint] = {
+            'requisicoes': len(medidas),
+            'erros': sum(1 for _, status in medidas if status >= 500),
+            'por_segundo': round(len(medidas) / duracao, 1),
+            'p50_ms': round(percentil(tempos, 0.5) * 1000, 2),
+            'p95_ms': round(percentil(tempos, 0.95) * 1000, 2),
+            'p99_ms': round(percentil(tempos, 0.99) * 1000, 2),
+            'max_ms': round(tempos[-1] * 1000, 2),
+        }
+    return {'requisicoes': len(amostras), 'segundos': round(duracao, 2),
+            'por_segundo': round(len(amostras) / duracao, 1), 'endpoints': endpoints}
+
+
+def medir(pasta, pessoas, requisicoes, threads, aquecimento, armazenamento='csv'):
+    # Roda em um processo novo: o app.py abre os arquivos do diretório atual
+    # ao ser importado
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(pasta)
+    if armazenamento == 'sqlite':
+        from banco import RegistroSQLite, importar_csv
+        importar_csv(RegistroSQLite('missaocalebe.db'))
+        os.environ['MISSAO_ARMAZENAMENTO'] = 'sqlite'
+        os.environ['MISSAO_BANCO'] = 'missaocalebe.db'
+    import app
+    return disparar(lambda: _cliente_flask(app.app), pessoas, requisicoes, threads, aquecimento)
+
+
+def comparar(atual, base, tolerancia, folga_ms):
+    # Pioras acima da tolerância (fração) em p95 ou vazão, por tamanho e
+    # endpoint. A folga evita acusar variação de poucos milissegundos.
+    pioras = []
+    for tamanho, resultado in atual.items():
+        if tamanho not in base:
+            continue
+        for endpoint, numeros in resultado['endpoints'].items():
+            anterior = base[tamanho]['endpoints'].get(endpoint)
+            if anterior is None:
+                continue
+            if numeros['p95_ms'] > anterior['p95_ms'] * (1 + tolerancia) + folga_ms:
+                pioras.append(f"{tamanho} pessoas, {endpoint}: p95 {anterior['p95_ms']} -> {numeros['p95_ms']} ms")
+            if numeros['erros'] > anterior['erros']:
+                pioras.append(f"{tamanho} pessoas, {endpoint}: erros {anterior['erros']} -> {numeros['erros']}")
+        if resultado['por_segundo'] < base[tamanho]['por_segundo'] * (1 - tolerancia):
+            pioras.append(f"{tamanho} pessoas: vazão {base[tamanho]['por_segundo']} -> "
+                          f"{resultado['por_segundo']} req/s")
+    return pioras
+
+
+def imprimir(tamanho, resultado):
+    print(f"\n{tamanho} pessoas: {resultado['requisicoes']} requisições em "
+          f"{resultado['segundos']} s ({resultado['por_segundo']} req/s)")
+    print(f"  {'endpoint':<18}{'n':>7}{'req/s':>9}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}{'erros':>7}")
+    for endpoint, numeros in resultado['endpoints'].items():
+        print(f"  {endpoint:<18}{numeros['requisicoes']:>7}{numeros['por_segundo']:>9}"
+              f"{numeros['p50_ms']:>10}{numeros['p95_ms']:>10}{numeros['p99_ms']:>10}"
+              f"{numeros['max_ms']:>10}{numeros['erros']:>7}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Teste de carga de marcar_presenca, letter, indicadores e realizar_sorteio.')
+    parser.add_argument('--tamanhos', type=int, nargs='+', default=list(TAMANHOS),
+                        help='quantidades de pessoas cadastradas')
+    parser.add_argument('--requisicoes', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--aquecimento', type=int, default=50)
+    parser.add_argument('--armazenamento', choices=['csv', 'sqlite'], default='csv')
+    parser.add_argument('--pasta', default='bench',
+                        help='onde gerar os dados sintéticos (<pasta>/<tamanho>)')
+    parser.add_argument('--gerar', action='store_true',
+                        help='só gera os dados, para subir um servidor (gunicorn) em cima deles')
+    parser.add_argument('--url', help='mede um servidor já rodando em vez do app em processo '
+                                      '(use com um único --tamanhos igual ao dos dados dele)')
+    parser.add_argument('--salvar', help='grava o resultado em JSON')
+    parser.add_argument('--comparar', help='JSON salvo antes; termina com erro se piorou')
+    parser.add_argument('--tolerancia', type=float, default=0.25)
+    parser.add_argument('--folga-ms', type=float, default=2.0)
+    args = parser.parse_args()
+
+    resultados = {}
+    for tamanho in args.tamanhos:
+        pasta = os.path.abspath(os.path.join(args.pasta, str(tamanho)))
+        if args.url:
+            resultado = disparar(lambda: _cliente_http(args.url), tamanho,
+                                 args.requisicoes, args.threads, args.aquecimento)
+        else:
+            inicio = time.perf_counter()
+            gerar_dados(pasta, tamanho)
+            print(f'{tamanho} pessoas geradas em {pasta} ({time.perf_counter() - inicio:.1f} s)')
+            if args.gerar:
+                continue
+            # Processo novo para cada tamanho: nada do anterior fica em memória
+            with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as pool:
+                resultado = pool.submit(medir, pasta, tamanho, args.requisicoes, args.threads,
+                                        args.aquecimento, args.armazenamento).result()
+        resultados[str(tamanho)] = resultado
+        imprimir(tamanho, resultado)
+
+    if args.salvar:
+        with open(args.salvar, 'w') as arquivo:
+            json.dump(resultados, arquivo, indent=2, ensure_ascii=False)
+    if args.comparar:
+        with open(args.comparar) as arquivo:
+            pioras = comparar(resultados, json.load(arquivo), args.tolerancia, args.folga_ms)
+        for piora in pioras:
+            print(f'PIOROU: {piora}')
+        sys.exit(1 if pioras else 0)
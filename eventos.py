@@ -0,0 +1,199 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+
+def cooperativo():
+    # True quando o gevent trocou as threads por greenlets (gunicorn -k
+    # gevent): aí uma conexão aberta não segura um worker
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+class Canal:
+    # Eventos do app (presença, cadastro, sorteio) para as telas conectadas
+    # em /eventos (Server-Sent Events).
+    #
+    # Qualquer worker publica acrescentando uma linha JSON em
+    # <pasta>/<dd-mm-YYYY>.jsonl. Em cada processo uma única thread acompanha
+    # esse arquivo, guarda os últimos eventos e acorda os clientes; os
+    # clientes só esperam na mesma Condition, sem thread própria. O id de
+    # cada evento é "<data>:<posição no arquivo>", igual em todos os
+    # workers, o que permite retomar a conexão pelo Last-Event-ID.
+    #
+    # Sem gevent (worker sync ou gthread do gunicorn, app.run) a conexão não
+    # fica aberta: cada requisição entrega o que veio depois do
+    # Last-Event-ID e termina, e o EventSource volta em `retry` ms. Assim
+    # uma tela aberta no painel nunca prende um worker.
+
+    def __init__(self, hoje, pasta='eventos', intervalo=0.5, maximo=1000, manter_dias=2):
+        self.hoje = hoje
+        self.pasta = pasta
+        self.intervalo = intervalo
+        self.manter_dias = manter_dias
+        self._condicao = threading.Condition()
+        self._eventos = deque(maxlen=maximo)  # (seq, data, posição, mensagem SSE)
+        self._seq = 0
+        self._lido = None  # (data, posição) até onde a thread já leu
+        self._thread = None
+
+    def _arquivo(self, data):
+        return os.path.join(self.pasta, f'{data}.jsonl')
+
+    def publicar(self, tipo, dados):
+        self.publicar_varios([(tipo, dados)])
+
+    def publicar_varios(self, eventos):
+        # Todos os eventos em uma única escrita
+        if not eventos:
+            return
+        os.makedirs(self.pasta, exist_ok=True)
+        linhas = ''.join(json.dumps({'tipo': tipo, 'dados': dados}, ensure_ascii=False) + '\n'
+                         for tipo, dados in eventos)
+        caminho = self._arquivo(self.hoje())
+        if not os.path.exists(caminho):
+            self._podar()
+        with open(caminho, 'a', encoding='utf-8') as arquivo:
+            arquivo.write(linhas)
+
+    def _podar(self):
+        # Chamado ao abrir o arquivo de um dia novo: os de mais de
+        # `manter_dias` dias não servem nem para retomar uma conexão
+        limite = time.time() - self.manter_dias * 86400
+        for nome in os.listdir(self.pasta):
+            caminho = os.path.join(self.pasta, nome)
+            try:
+                if nome.endswith('.jsonl') and os.stat(caminho).st_mtime < limite:
+                    os.remove(caminho)
+            except FileNotFoundError:
+                pass
+
+    def _iniciar(self):
+        # A thread é criada no primeiro cliente, já dentro do worker. A
+        # primeira leitura (o arquivo de hoje desde o começo, para quem volta
+        # com Last-Event-ID) é feita aqui, antes de qualquer cliente escutar.
+        with self._condicao:
+            if self._thread is None:
+                data = self.hoje()
+                posicao = self._guardar(data, 0)
+                self._thread = threading.Thread(target=self._acompanhar, args=(data, posicao),
+                                                daemon=True)
+                self._thread.start()
+
+    def _ler(self, data, posicao):
+        # Eventos completos de <data>.jsonl a partir de `posicao` (None: o
+        # fim do arquivo). Retorna ([(posição, mensagem)], nova posição).
+        novos = []
+        try:
+            with open(self._arquivo(data), 'rb') as arquivo:
+                if posicao is None:
+                    posicao = arquivo.seek(0, os.SEEK_END)
+                arquivo.seek(posicao)
+                for linha in iter(arquivo.readline, b''):
+                    if not linha.endswith(b'\n'):
+                        break  # Linha ainda sendo gravada
+                    posicao += len(linha)
+                    try:
+                        evento = json.loads(linha)
+                    except ValueError as erro:
+                        print(f'Evento inválido em {self._arquivo(data)}: {erro}')
+                        continue
+                    novos.append((posicao, (
+                        f'id: {data}:{posicao}\n'
+                        f'event: {evento["tipo"]}\n'
+                        f'data: {json.dumps(evento["dados"], ensure_ascii=False)}\n\n')))
+        except FileNotFoundError:
+            posicao = 0
+        return novos, posicao
+
+    def _guardar(self, data, posicao):
+        novos, posicao = self._ler(data, posicao)
+        with self._condicao:
+            self._lido = (data, posicao)
+            if novos:
+                for posicao_evento, mensagem in novos:
+                    self._seq += 1
+                    self._eventos.append((self._seq, data, posicao_evento, mensagem))
+                self._condicao.notify_all()
+        return posicao
+
+    def _acompanhar(self, data, posicao):
+        while True:
+            time.sleep(self.intervalo)
+            if self.hoje() != data:
+                data, posicao = self.hoje(), 0
+            posicao = self._guardar(data, posicao)
+
+    def _posteriores(self, ultimo):
+        return [evento for evento in self._eventos if evento[0] > ultimo]
+
+    @staticmethod
+    def _separar(ultimo_id):
+        # "<data>:<posição>" -> (data, posição), ou (None, None) se inválido
+        data, _, posicao = (ultimo_id or '').rpartition(':')
+        try:
+            return (data, int(posicao)) if data else (None, None)
+        except ValueError:
+            return None, None
+
+    def escutar(self, ultimo_id=None, duracao=300, pulso=15, retry=3000):
+        # Gerador de mensagens SSE. Com gevent a conexão fica aberta por
+        # `duracao` segundos; sem ele só entrega o que está pendente.
+        if not cooperativo():
+            return self._consultar(ultimo_id, retry)
+        return self._transmitir(ultimo_id, duracao, pulso, retry)
+
+    def _consultar(self, ultimo_id, retry):
+        data = self.hoje()
+        data_vista, posicao = self._separar(ultimo_id)
+        if data_vista is None:
+            posicao = None  # Primeira conexão: começa do fim
+        elif data_vista != data:
+            posicao = 0  # Virou o dia: tudo do arquivo de hoje é novo
+        novos, posicao = self._ler(data, posicao)
+        mensagens = [f'retry: {retry}\n\n'] + [mensagem for _, mensagem in novos]
+        # Sem `data` o navegador não dispara evento, mas guarda o id para
+        # mandar no Last-Event-ID da próxima vez
+        mensagens.append(f'id: {data}:{posicao}\n\n')
+        return iter(mensagens)
+
+    def _transmitir(self, ultimo_id, duracao, pulso, retry):
+        self._iniciar()
+        data_vista, posicao = self._separar(ultimo_id)
+        with self._condicao:
+            ultimo = self._seq
+            do_dia = [(seq, pos) for seq, data, pos, _ in self._eventos if data == data_vista]
+            if do_dia:
+                ultimo = max((seq for seq, pos in do_dia if pos <= posicao),
+                             default=do_dia[0][0] - 1)
+            # Nada pendente: o id garante que a reconexão não pule eventos
+            ancora = None if self._seq > ultimo else '{}:{}'.format(*self._lido)
+
+        yield f'retry: {retry}\n\n'
+        if ancora:
+            yield f'id: {ancora}\n\n'
+        fim = time.monotonic() + duracao
+        while time.monotonic() < fim:
+            with self._condicao:
+                pendentes = self._posteriores(ultimo)
+                if not pendentes:
+                    self._condicao.wait(pulso)
+                    pendentes = self._posteriores(ultimo)
+                perdidos = bool(pendentes) and pendentes[0][0] > ultimo + 1
+            if perdidos:
+                # Chegaram mais eventos do que cabem em `maximo` desde a
+                # última entrega: a tela recarrega em vez de ficar com
+                # números errados
+                yield 'event: recarregar\ndata: {}\n\n'
+                return
+            if not pendentes:
+                yield ': pulso\n\n'
+                continue
+            for seq, _, _, mensagem in pendentes:
+                ultimo = seq
+                yield mensagem
@@ -0,0 +1,97 @@
+import os
+import tempfile
+import threading
+import time
+
+import pandas as pd
+from openpyxl import Workbook
+
+from analise import analise_atual
+
+
+class ExportacaoExcel:
+    # Planilha de indicadores gerada uma vez por versão dos dados e guardada
+    # em <pasta>/indicadores-<assinatura>.xlsx. Downloads da mesma versão
+    # reaproveitam o arquivo; alterações agendam uma nova geração em segundo
+    # plano.
+
+    def __init__(self, registro, datas, pasta='cache', atraso=5, guardar=300):
+        self.registro = registro
+        self.datas = datas
+        self.pasta = pasta
+        self.atraso = atraso
+        self.guardar = guardar  # Segundos que uma versão antiga fica no disco
+        self._trava = threading.Lock()
+        self._trava_agendamento = threading.Lock()  # Não espera uma geração em curso
+        self._agendamento = None
+
+    def _caminho(self, assinatura):
+        return os.path.join(self.pasta, f'indicadores-{assinatura}.xlsx')
+
+    def caminho(self):
+        # Caminho da planilha da versão atual, gerando se ainda não existir
+        assinatura = self.registro.assinatura()
+        caminho = self._caminho(assinatura)
+        if os.path.isfile(caminho):
+            return caminho
+        with self._trava:
+            if not os.path.isfile(caminho):
+                self._gerar(caminho)
+                self._limpar(caminho)
+        return caminho
+
+    def _gerar(self, destino):
+        # Workbook em modo write-only grava linha a linha, sem manter as
+        # células em memória. O arquivo só aparece no destino completo.
+        os.makedirs(self.pasta, exist_ok=True)
+        planilha = Workbook(write_only=True)
+        for aba, tabela in analise_atual(self.registro, idade_maxima=0).planilhas(self.datas).items():
+            folha = planilha.create_sheet(aba)
+            folha.append(list(tabela.columns))
+            for linha in tabela.itertuples(index=False):
+                folha.append([None if pd.isna(valor) else valor for valor in linha])
+
+        descritor, temporario = tempfile.mkstemp(dir=self.pasta, suffix='.xlsx')
+        os.close(descritor)
+        try:
+            planilha.save(temporario)
+            os.replace(temporario, destino)
+        except BaseException:
+            os.remove(temporario)
+            raise
+
+    def _limpar(self, atual):
+        # Só apaga as versões com mais de `guardar` segundos: uma requisição
+        # (deste ou de outro worker) pode ter acabado de receber o caminho
+        # de uma versão anterior e ainda não ter aberto o arquivo
+        limite = time.time() - self.guardar
+        for nome in os.listdir(self.pasta):
+            caminho = os.path.join(self.pasta, nome)
+            if not nome.startswith('indicadores-') or caminho == atual:
+                continue
+            try:
+                if os.stat(caminho).st_mtime < limite:
+                    os.remove(caminho)
+            except FileNotFoundError:
+                pass
+
+    def agendar(self):
+        # Gera no máximo uma vez a cada `atraso` segundos: as alterações
+        # que chegam com uma geração já agendada entram nela. (Adiar a cada
+        # alteração nunca geraria enquanto as presenças não param.)
+        with self._trava_agendamento:
+            if self._agendamento is not None:
+                return
+            self._agendamento = threading.Timer(self.atraso, self._gerar_agendado)
+            self._agendamento.daemon = True
+            self._agendamento.start()
+
+    def _gerar_agendado(self):
+        # Libera o agendamento antes de gerar: uma alteração durante a
+        # geração agenda a próxima
+        with self._trava_agendamento:
+            self._agendamento = None
+        try:
+            self.caminho()
+        except Exception as erro:
+            print(f'Erro ao gerar planilha de indicadores: {erro}')
@@ -0,0 +1,87 @@
+import hashlib
+import io
+import os
+
+from arquivos import escrita_atomica
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Sem Pillow as imagens são gravadas como vieram
+    Image = None
+PILLOW = Image is not None
+
+LADO_MAXIMO = 1600
+
+# Variantes geradas para cada imagem: nome -> maior lado em pixels. Cada uma
+# é gravada em WebP e em JPEG como <base>-<variante>.<webp|jpg>.
+VARIANTES = {'mini': 320, 'card': 800, 'full': 1600}
+FORMATOS_VARIANTES = {'webp': ('WEBP', {'quality': 80, 'method': 4}),
+                      'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True})}
+
+
+def nome_com_hash(dados, prefixo, extensao):
+    # O nome muda junto com o conteúdo, então pode ser servido com cache longo
+    return f'{prefixo}_{hashlib.sha256(dados).hexdigest()[:16]}.{extensao}'
+
+
+def nome_variante(nome, variante, formato):
+    return f'{os.path.splitext(nome)[0]}-{variante}.{formato}'
+
+
+def nomes_variantes(nome):
+    return [nome_variante(nome, variante, formato)
+            for variante in VARIANTES for formato in FORMATOS_VARIANTES]
+
+
+def _salvar(imagem, caminho, formato, opcoes=None):
+    if opcoes is None:
+        opcoes = {}
+        if formato == 'JPEG':
+            opcoes = {'quality': 85, 'optimize': True, 'progressive': True}
+        elif formato == 'PNG':
+            opcoes = {'optimize': True}
+    if formato == 'JPEG' and imagem.mode not in ('RGB', 'L'):
+        imagem = imagem.convert('RGB')
+    elif formato == 'WEBP' and imagem.mode not in ('RGB', 'RGBA'):
+        imagem = imagem.convert('RGBA' if 'A' in imagem.getbands() or 'transparency' in imagem.info else 'RGB')
+    with escrita_atomica(caminho, modo='wb') as arquivo:
+        imagem.save(arquivo, format=formato, **opcoes)
+
+
+def _variantes(imagem, pasta, nome):
+    # Da maior para a menor, reduzindo a mesma cópia
+    imagem = imagem.copy()
+    for variante, lado in sorted(VARIANTES.items(), key=lambda item: -item[1]):
+        imagem.thumbnail((lado, lado))
+        for extensao, (formato, opcoes) in FORMATOS_VARIANTES.items():
+            _salvar(imagem, os.path.join(pasta, nome_variante(nome, variante, extensao)),
+                    formato, opcoes)
+
+
+def gerar_variantes(pasta, nome):
+    # Roda em um processo do pool: lê <pasta>/<nome>, já gravado pela
+    # requisição, e grava as variantes ao lado dele
+    if Image is None:
+        return []
+    with Image.open(os.path.join(pasta, nome)) as original:
+        _variantes(ImageOps.exif_transpose(original), pasta, nome)
+    return nomes_variantes(nome)
+
+
+def processar_imagem(dados, pasta, nome):
+    # Roda em um processo do pool (por isso fica fora do n.py): decodifica,
+    # corrige a rotação da câmera, reduz para no máximo LADO_MAXIMO e gera
+    # as variantes. Retorna os nomes gravados em `pasta`.
+    destino = os.path.join(pasta, nome)
+    if Image is None:
+        with escrita_atomica(destino, modo='wb') as arquivo:
+            arquivo.write(dados)
+        return {'imagem': nome, 'variantes': []}
+
+    with Image.open(io.BytesIO(dados)) as original:
+        formato = original.format
+        imagem = ImageOps.exif_transpose(original)
+        imagem.thumbnail((LADO_MAXIMO, LADO_MAXIMO))
+        _salvar(imagem, destino, formato)
+        _variantes(imagem, pasta, nome)
+    return {'imagem': nome, 'variantes': nomes_variantes(nome)}
@@ -0,0 +1,221 @@
+import argparse
+import csv
+import io
+import os
+import re
+
+from openpyxl import load_workbook
+
+from banco import RegistroSQLite
+from registro import Registro, normalizar_nome
+
+# Nomes de coluna aceitos nas planilhas das igrejas, já normalizados
+APELIDOS = {
+    'nome': ['nome', 'nome completo'],
+    'idade': ['idade'],
+    'cep': ['cep'],
+    'rua': ['rua', 'endereco', 'logradouro'],
+    'bairro': ['bairro'],
+    'casa': ['casa', 'numero', 'no', 'n'],
+    'telefone': ['telefone', 'contato', 'celular', 'whatsapp', 'fone'],
+    'como_soube': ['como soube', 'como ficou sabendo', 'como ficou sabendo do evento'],
+}
+COLUNA_POR_APELIDO = {apelido: campo for campo, apelidos in APELIDOS.items()
+                      for apelido in apelidos}
+
+# Mesmas opções do formulário de cadastro (templates/add.html)
+OPCOES_COMO_SOUBE = ['convite', 'propaganda', 'banner', 'outro']
+
+TAMANHO_LOTE = 500
+MAXIMO_ERROS = 100
+
+
+class LinhaInvalida(ValueError):
+    pass
+
+
+def _texto(valor):
+    # Células numéricas do Excel chegam como float (92999999999.0)
+    if valor is None:
+        return ''
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)
+    return ' '.join(str(valor).split())
+
+
+def _coluna(cabecalho):
+    chave = normalizar_nome(_texto(cabecalho)).replace('_', ' ').rstrip(':.')
+    return COLUNA_POR_APELIDO.get(chave)
+
+
+def ler_csv(arquivo, codificacao='utf-8-sig'):
+    # Linhas de um CSV binário, lidas sob demanda. Aceita vírgula, ponto e
+    # vírgula (Excel em português) ou tabulação.
+    texto = io.TextIOWrapper(arquivo, encoding=codificacao, newline='')
+    amostra = texto.read(4096)
+    texto.seek(0)
+    try:
+        dialeto = csv.Sniffer().sniff(amostra, delimiters=',;\t')
+    except csv.Error:
+        dialeto = csv.excel
+    yield from csv.reader(texto, dialeto)
+
+
+def ler_xlsx(arquivo):
+    # Primeira aba da planilha em modo read-only, linha a linha
+    planilha = load_workbook(arquivo, read_only=True, data_only=True)
+    try:
+        yield from planilha.worksheets[0].iter_rows(values_only=True)
+    finally:
+        planilha.close()
+
+
+def ler_planilha(arquivo, nome_arquivo, codificacao='utf-8-sig'):
+    if nome_arquivo.lower().endswith(('.xlsx', '.xlsm')):
+        return ler_xlsx(arquivo)
+    return ler_csv(arquivo, codificacao)
+
+
+def normalizar_telefone(valor, ddd_padrao='92'):
+    digitos = re.sub(r'\D', '', _texto(valor))
+    if len(digitos) in (12, 13) and digitos.startswith('55'):
+        digitos = digitos[2:]
+    if len(digitos) in (8, 9) and ddd_padrao:
+        digitos = ddd_padrao + digitos
+    if len(digitos) not in (10, 11):
+        raise LinhaInvalida(f'telefone inválido: {_texto(valor)!r}')
+    return digitos
+
+
+def normalizar_cep(valor):
+    if not _texto(valor):
+        return ''
+    digitos = re.sub(r'\D', '', _texto(valor))
+    # Planilhas guardam o CEP como número e perdem o zero à esquerda
+    if len(digitos) == 7:
+        digitos = '0' + digitos
+    if len(digitos) != 8:
+        raise LinhaInvalida(f'CEP inválido: {_texto(valor)!r}')
+    return digitos
+
+
+def normalizar_como_soube(valor, padrao='convite'):
+    chave = normalizar_nome(_texto(valor))
+    if not chave:
+        return padrao
+    return chave if chave in OPCOES_COMO_SOUBE else 'outro'
+
+
+def normalizar_idade(valor):
+    idade = _texto(valor)
+    if idade and not (idade.isdigit() and int(idade) <= 120):
+        raise LinhaInvalida(f'idade inválida: {idade!r}')
+    return idade
+
+
+def normalizar(campos, ddd_padrao='92', como_soube_padrao='convite'):
+    # Campos do cadastro na ordem de COLUNAS[1:9]
+    nome = _texto(campos.get('nome'))
+    if not nome:
+        raise LinhaInvalida('nome em branco')
+    return [
+        nome,
+        normalizar_idade(campos.get('idade')),
+        normalizar_cep(campos.get('cep')),
+        _texto(campos.get('rua')),
+        _texto(campos.get('bairro')),
+        _texto(campos.get('casa')),
+        normalizar_telefone(campos.get('telefone'), ddd_padrao),
+        normalizar_como_soube(campos.get('como_soube'), como_soube_padrao),
+    ]
+
+
+def chave_pessoa(nome, telefone, ddd_padrao='92'):
+    # O telefone do formulário fica como foi digitado ("98888-7777"): passa
+    # pela mesma normalização da planilha, ou fica só com os dígitos
+    try:
+        telefone = normalizar_telefone(telefone, ddd_padrao)
+    except LinhaInvalida:
+        telefone = re.sub(r'\D', '', telefone or '')
+    return normalizar_nome(nome), telefone
+
+
+def importar(registro, linhas, simular=False, ddd_padrao='92',
+             como_soube_padrao='convite', tamanho_lote=TAMANHO_LOTE):
+    # Gerador: valida as linhas em lotes de `tamanho_lote`, informando o
+    # progresso a cada lote, e grava todos os cadastros válidos de uma vez
+    # no final (registro.adicionar_varios). Quem já está cadastrado com o
+    # mesmo nome e telefone, ou aparece repetido na planilha, é ignorado.
+    # O último item traz o resumo com 'concluido': True.
+    linhas = iter(linhas)
+    cabecalho = next(linhas, None) or []
+    colunas = [_coluna(celula) for celula in cabecalho]
+    if 'nome' not in colunas:
+        raise LinhaInvalida('a planilha precisa de uma coluna "nome"')
+
+    existentes = {chave_pessoa(pessoa['nome'], pessoa['telefone'], ddd_padrao)
+                  for pessoa in registro.pessoas()}
+    validos, erros = [], []
+    progresso = {'lidas': 0, 'validas': 0, 'duplicadas': 0, 'invalidas': 0}
+
+    for numero, linha in enumerate(linhas, start=2):
+        if not any(_texto(celula) for celula in linha):
+            continue
+        progresso['lidas'] += 1
+        campos = {coluna: celula for coluna, celula in zip(colunas, linha) if coluna}
+        try:
+            cadastro = normalizar(campos, ddd_padrao, como_soube_padrao)
+        except LinhaInvalida as erro:
+            progresso['invalidas'] += 1
+            if len(erros) < MAXIMO_ERROS:
+                erros.append({'linha': numero, 'erro': str(erro)})
+        else:
+            chave = chave_pessoa(cadastro[0], cadastro[6], ddd_padrao)
+            if chave in existentes:
+                progresso['duplicadas'] += 1
+            else:
+                existentes.add(chave)
+                validos.append(cadastro)
+                progresso['validas'] += 1
+        if progresso['lidas'] % tamanho_lote == 0:
+            yield dict(progresso)
+
+    ids = []
+    if validos and not simular:
+        ids = registro.adicionar_varios(validos)
+    yield dict(progresso, concluido=True, simulacao=simular, importadas=len(ids),
+               ids=ids, cadastros=validos, erros=erros)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Importa uma lista de pessoas (CSV ou XLSX) para o cadastro.')
+    parser.add_argument('planilha')
+    parser.add_argument('--dados', default='dados.csv')
+    parser.add_argument('--diario', default='presencas.csv')
+    parser.add_argument('--sorteio', default='sorteio')
+    parser.add_argument('--banco', help='importa no SQLite em vez do dados.csv')
+    parser.add_argument('--codificacao', default='utf-8-sig')
+    parser.add_argument('--ddd', default='92')
+    parser.add_argument('--simular', action='store_true',
+                        help='só valida, sem gravar')
+    args = parser.parse_args()
+
+    if args.banco:
+        registro = RegistroSQLite(args.banco)
+    else:
+        registro = Registro(args.dados, args.diario, args.sorteio)
+
+    with open(args.planilha, 'rb') as arquivo:
+        linhas = ler_planilha(arquivo, os.path.basename(args.planilha),
+                              args.codificacao)
+        for progresso in importar(registro, linhas, args.simular, args.ddd):
+            print(f"{progresso['lidas']} linhas lidas, {progresso['validas']} válidas, "
+                  f"{progresso['duplicadas']} já cadastradas, "
+                  f"{progresso['invalidas']} inválidas")
+    for erro in progresso['erros']:
+        print(f"  linha {erro['linha']}: {erro['erro']}")
+    if args.simular:
+        print('Simulação: nada foi gravado')
+    else:
+        print(f"{progresso['importadas']} pessoas importadas")
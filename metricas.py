@@ -0,0 +1,219 @@
+import bisect
+import contextlib
+import functools
+import os
+import threading
+import time
+from collections import deque
+
+from flask import Response, request
+
+# Limites (em segundos) dos baldes do histograma de duração
+LIMITES = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUANTIS = (0.5, 0.95, 0.99)
+
+
+class _Serie:
+    # Números de um endpoint
+    __slots__ = ('contagem', 'soma', 'baldes', 'erros', 'em_andamento', 'io', 'recentes')
+
+    def __init__(self, baldes, recentes):
+        self.contagem = 0
+        self.soma = 0.0
+        self.baldes = [0] * (baldes + 1)  # o último é o +Inf
+        self.erros = 0
+        self.em_andamento = 0
+        self.io = {}  # tipo ('arquivo', 'db') -> segundos
+        self.recentes = deque(maxlen=recentes)
+
+
+class Metricas:
+    # Duração, vazão, erros, requisições em andamento e tempo de E/S por
+    # endpoint, expostos no formato texto do Prometheus.
+    #
+    # Uma série por endpoint, atualizada sob uma trava que só fica presa
+    # por algumas somas no início e no fim da requisição (o resto do estado
+    # da requisição fica na thread). Os quantis p50/p95/p99 saem das
+    # últimas `recentes` durações de cada endpoint; o histograma cumulativo
+    # serve para o histogram_quantile do Prometheus. Com vários workers
+    # cada processo tem os seus números (o rótulo `pid` separa).
+
+    def __init__(self, prefixo='missao', limites=LIMITES, recentes=1000):
+        self.prefixo = prefixo
+        self.limites = tuple(limites)
+        self.recentes = recentes
+        self.inicio = time.time()
+        self._local = threading.local()
+        self._series = {}  # endpoint -> _Serie
+        self._trava = threading.Lock()
+
+    def _serie(self, endpoint):
+        # Chame com a trava
+        serie = self._series.get(endpoint)
+        if serie is None:
+            serie = self._series[endpoint] = _Serie(len(self.limites), self.recentes)
+        return serie
+
+    # --- Ciclo da requisição ---
+    def iniciar(self, endpoint):
+        with self._trava:
+            self._serie(endpoint).em_andamento += 1
+        self._local.atual = {'endpoint': endpoint, 'inicio': time.perf_counter(),
+                             'io': {}, 'status': None}
+
+    def status(self, codigo):
+        atual = getattr(self._local, 'atual', None)
+        if atual is not None:
+            atual['status'] = codigo
+
+    def finalizar(self, erro=False):
+        atual = getattr(self._local, 'atual', None)
+        if atual is None:
+            return
+        self._local.atual = None
+        duracao = time.perf_counter() - atual['inicio']
+        balde = bisect.bisect_left(self.limites, duracao)
+        with self._trava:
+            serie = self._serie(atual['endpoint'])
+            serie.em_andamento -= 1
+            serie.contagem += 1
+            serie.soma += duracao
+            serie.baldes[balde] += 1
+            serie.recentes.append(duracao)
+            if erro or (atual['status'] or 0) >= 500:
+                serie.erros += 1
+            for tipo, segundos in atual['io'].items():
+                serie.io[tipo] = serie.io.get(tipo, 0.0) + segundos
+
+    def adicionar_io(self, tipo, segundos):
+        # Soma na requisição desta thread; fora de requisição não conta
+        atual = getattr(self._local, 'atual', None)
+        if atual is not None:
+            atual['io'][tipo] = atual['io'].get(tipo, 0.0) + segundos
+
+    @contextlib.contextmanager
+    def medir_io(self, tipo):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.adicionar_io(tipo, time.perf_counter() - inicio)
+
+    def instrumentar(self, objeto, tipo):
+        # Envolve um objeto (o registro, por exemplo) para que o tempo de
+        # cada método chamado conte como E/S do tipo `tipo`
+        return _Medido(self, objeto, tipo)
+
+    def instalar(self, app, rota='/metrics'):
+        # Registra os ganchos no app e a rota do Prometheus. Chame logo
+        # depois de criar o app, antes dos outros before_request.
+        @app.before_request
+        def iniciar_metricas():
+            self.iniciar(request.endpoint or 'unknown')
+
+        @app.after_request
+        def status_metricas(resposta):
+            self.status(resposta.status_code)
+            return resposta
+
+        @app.teardown_request
+        def finalizar_metricas(erro):
+            self.finalizar(erro is not None)
+
+        @app.route(rota)
+        def metricas():
+            return Response(self.texto(), mimetype='text/plain; version=0.0.4')
+
+    # --- Leitura ---
+    def _copia(self):
+        # Cópia das séries para montar o texto fora da trava
+        with self._trava:
+            return {endpoint: {
+                'contagem': serie.contagem, 'soma': serie.soma,
+                'baldes': list(serie.baldes), 'erros': serie.erros,
+                'em_andamento': serie.em_andamento, 'io': dict(serie.io),
+                'recentes': list(serie.recentes)}
+                for endpoint, serie in self._series.items()}
+
+    def texto(self):
+        # Formato de exposição texto do Prometheus (versão 0.0.4)
+        p = self.prefixo
+        pid = os.getpid()
+        series = sorted(self._copia().items())
+        linhas = []
+
+        def metrica(nome, tipo, ajuda):
+            linhas.append(f'# HELP {p}_{nome} {ajuda}')
+            linhas.append(f'# TYPE {p}_{nome} {tipo}')
+
+        def rotulos(**valores):
+            return '{' + ','.join(f'{chave}="{_escapar(valor)}"'
+                                  for chave, valor in valores.items()) + '}'
+
+        metrica('requisicao_segundos', 'histogram', 'Duração das requisições por endpoint.')
+        for endpoint, total in series:
+            acumulado = 0
+            for limite, quantidade in zip(self.limites + ('+Inf',), total['baldes']):
+                acumulado += quantidade
+                linhas.append(f'{p}_requisicao_segundos_bucket'
+                              f'{rotulos(endpoint=endpoint, pid=pid, le=limite)} {acumulado}')
+            linhas.append(f'{p}_requisicao_segundos_sum{rotulos(endpoint=endpoint, pid=pid)} {total["soma"]:.6f}')
+            linhas.append(f'{p}_requisicao_segundos_count{rotulos(endpoint=endpoint, pid=pid)} {total["contagem"]}')
+
+        metrica('requisicao_quantil_segundos', 'gauge',
+                f'Quantis das últimas {self.recentes} requisições de cada endpoint.')
+        for endpoint, total in series:
+            recentes = sorted(total['recentes'])
+            for quantil in QUANTIS:
+                linhas.append(f'{p}_requisicao_quantil_segundos'
+                              f'{rotulos(endpoint=endpoint, pid=pid, quantile=quantil)} '
+                              f'{percentil(recentes, quantil):.6f}')
+
+        metrica('requisicoes_em_andamento', 'gauge', 'Requisições sendo atendidas agora.')
+        for endpoint, total in series:
+            linhas.append(f'{p}_requisicoes_em_andamento{rotulos(endpoint=endpoint, pid=pid)} {total["em_andamento"]}')
+
+        metrica('erros_total', 'counter', 'Requisições que terminaram com exceção ou status 5xx.')
+        for endpoint, total in series:
+            linhas.append(f'{p}_erros_total{rotulos(endpoint=endpoint, pid=pid)} {total["erros"]}')
+
+        metrica('io_segundos_total', 'counter', 'Tempo gasto em arquivo/banco durante as requisições.')
+        for endpoint, total in series:
+            for tipo, segundos in sorted(total['io'].items()):
+                linhas.append(f'{p}_io_segundos_total{rotulos(endpoint=endpoint, pid=pid, tipo=tipo)} {segundos:.6f}')
+
+        metrica('processo_inicio_segundos', 'gauge', 'Início do processo (epoch).')
+        linhas.append(f'{p}_processo_inicio_segundos{rotulos(pid=pid)} {self.inicio:.3f}')
+        return '\n'.join(linhas) + '\n'
+
+
+class _Medido:
+    def __init__(self, metricas, objeto, tipo):
+        self._metricas = metricas
+        self._objeto = objeto
+        self._tipo = tipo
+
+    def __getattr__(self, nome):
+        valor = getattr(self._objeto, nome)
+        if not callable(valor):
+            return valor
+
+        @functools.wraps(valor)
+        def medido(*args, **kwargs):
+            with self._metricas.medir_io(self._tipo):
+                return valor(*args, **kwargs)
+        return medido
+
+
+def percentil(ordenados, quantil):
+    # Interpolação linear entre as amostras (mesmo critério do numpy)
+    if not ordenados:
+        return 0.0
+    posicao = (len(ordenados) - 1) * quantil
+    baixo = int(posicao)
+    alto = min(baixo + 1, len(ordenados) - 1)
+    return ordenados[baixo] + (ordenados[alto] - ordenados[baixo]) * (posicao - baixo)
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -1,20 +1,56 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory
+from flask import Flask, render_template, render_template_string, request, redirect, url_for, flash, jsonify, session, abort, g, has_request_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin, LoginManager, login_user, logout_user, login_required, current_user
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import atexit
+import contextlib
+import multiprocessing
 import os
+import queue
+import hashlib
+import base64
 import csv
-from io import StringIO
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from collections import deque
+from types import SimpleNamespace
+import io
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
+from sqlalchemy import event, func, or_, select, tuple_
+from sqlalchemy.engine import Engine
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from arquivos import escrita_atomica, travado
+from ativos import Ativos
+from metricas import Metricas
+from imagens import PILLOW, VARIANTES, gerar_variantes, nome_com_hash, nome_variante, nomes_variantes, processar_imagem
 
 # --- Configurações Iniciais ---
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///corridas.db'
+# CORRIDAS_BANCO troca o banco (ex.: sqlite:////tmp/corridas.db nos testes)
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('CORRIDAS_BANCO', 'sqlite:///corridas.db')
 app.config['SECRET_KEY'] = 'sua_chave_secreta_aqui_mude_em_producao'
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif'} # Para corridas/blog
 app.config['ALLOWED_ZIP_EXTENSIONS'] = {'zip'} # Para importação de imagens
+app.config['MAX_IMAGEM_ZIP'] = 20 * 1024 * 1024 # Tamanho máximo de cada imagem dentro do ZIP
+app.config['PROCESSOS_IMAGENS'] = os.cpu_count() or 2
+app.config['RETENCAO_ACESSOS_DIAS'] = 90 # Acessos individuais; os totais por dia ficam para sempre
+app.config['RETENCAO_ACESSOS_HORA_DIAS'] = 90
+app.config['ARQUIVO_VERSAO_FEED'] = 'feed.versao' # Trocado a cada alteração de corridas/promoções
+app.config['ITENS_POR_PAGINA'] = 30
+app.config['CONSULTA_LENTA_MS'] = 100 # Consultas acima disso aparecem em /admin/perf
+app.config['CABECALHO_PERFIL_SQL'] = False # Server-Timing com as consultas de cada resposta (sempre ligado em debug)
+app.config['CACHE_USUARIO_SEGUNDOS'] = 60
+
+# Duração, erros e E/S por endpoint em /metrics (formato do Prometheus)
+metricas = Metricas()
+metricas.instalar(app)
 
 db = SQLAlchemy(app)
 login_manager = LoginManager()
@@ -23,6 +59,83 @@ login_manager.login_view = 'login'
 login_manager.login_message = "Por favor, faça login para acessar esta página."
 login_manager.login_message_category = "warning"
 
+# --- Perfil das consultas SQL ---
+class PerfilConsultas:
+    # Mede cada consulta (eventos do SQLAlchemy) e soma por requisição em
+    # `g`: quantidade e tempo total. Ao fim da requisição acumula por
+    # endpoint e, se ligado, devolve no cabeçalho Server-Timing (aparece na
+    # aba de rede do navegador). As consultas mais lentas que
+    # `limite_lenta` segundos ficam guardadas, inclusive as das threads de
+    # fundo.
+
+    def __init__(self, limite_lenta=0.1, maximo_lentas=50):
+        self.limite_lenta = limite_lenta
+        self.lentas = deque(maxlen=maximo_lentas)
+        self._por_endpoint = {}
+        self._trava = threading.Lock()
+        event.listen(Engine, 'before_cursor_execute', self._antes)
+        event.listen(Engine, 'after_cursor_execute', self._depois)
+
+    def _antes(self, conexao, cursor, sql, parametros, contexto, varios):
+        conexao.info.setdefault('inicio_consultas', []).append(time.perf_counter())
+
+    def _depois(self, conexao, cursor, sql, parametros, contexto, varios):
+        duracao = time.perf_counter() - conexao.info['inicio_consultas'].pop()
+        metricas.adicionar_io('db', duracao)
+        endpoint = None
+        if has_request_context():
+            endpoint = request.endpoint
+            perfil = g.get('perfil_sql')
+            if perfil is not None:
+                perfil[0] += 1
+                perfil[1] += duracao
+        if duracao >= self.limite_lenta:
+            with self._trava:
+                self.lentas.append({'sql': ' '.join(sql.split())[:500], 'ms': round(duracao * 1000, 1),
+                                    'endpoint': endpoint, 'quando': datetime.utcnow().isoformat(timespec='seconds')})
+
+    def iniciar_requisicao(self):
+        g.perfil_sql = [0, 0.0]
+
+    def finalizar_requisicao(self, resposta, cabecalho=False):
+        consultas, tempo = g.get('perfil_sql', (0, 0.0))
+        endpoint = request.endpoint or 'unknown'
+        with self._trava:
+            total = self._por_endpoint.setdefault(
+                endpoint, {'requisicoes': 0, 'consultas': 0, 'tempo': 0.0, 'maximo_consultas': 0})
+            total['requisicoes'] += 1
+            total['consultas'] += consultas
+            total['tempo'] += tempo
+            total['maximo_consultas'] = max(total['maximo_consultas'], consultas)
+        if cabecalho:
+            resposta.headers.add('Server-Timing', f'db;dur={tempo * 1000:.1f};desc="{consultas} consultas"')
+        return resposta
+
+    def estado(self):
+        with self._trava:
+            endpoints = [{'endpoint': endpoint,
+                          'requisicoes': total['requisicoes'],
+                          'consultas_por_requisicao': round(total['consultas'] / total['requisicoes'], 2),
+                          'maximo_consultas': total['maximo_consultas'],
+                          'ms_por_requisicao': round(total['tempo'] * 1000 / total['requisicoes'], 2),
+                          'ms_total': round(total['tempo'] * 1000, 1)}
+                         for endpoint, total in self._por_endpoint.items()]
+            lentas = list(reversed(self.lentas))
+        endpoints.sort(key=lambda item: item['ms_total'], reverse=True)
+        return {'endpoints': endpoints, 'lentas': lentas,
+                'limite_lenta_ms': round(self.limite_lenta * 1000)}
+
+perfil_sql = PerfilConsultas(app.config['CONSULTA_LENTA_MS'] / 1000)
+
+@app.before_request
+def iniciar_perfil_sql():
+    perfil_sql.iniciar_requisicao()
+
+@app.after_request
+def finalizar_perfil_sql(resposta):
+    return perfil_sql.finalizar_requisicao(
+        resposta, app.debug or app.config['CABECALHO_PERFIL_SQL'])
+
 def allowed_file(filename, allowed_extensions):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in allowed_extensions
@@ -43,7 +156,7 @@ class Usuario(UserMixin, db.Model):
 class Corrida(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     nome = db.Column(db.String(100), nullable=False)
-    data = db.Column(db.DateTime, nullable=False)
+    data = db.Column(db.DateTime, nullable=False, index=True)
     local = db.Column(db.String(200), nullable=False)
     valor = db.Column(db.Float, nullable=False)
     distancia = db.Column(db.Float, nullable=False)
@@ -52,11 +165,15 @@ class Corrida(db.Model):
     promovida = db.Column(db.Boolean, default=False) # Nova flag
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_corrida_nome_data', 'nome', 'data', unique=True), # Chave natural da importação
+    )
+
 class Post(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     titulo = db.Column(db.String(100), nullable=False)
     conteudo = db.Column(db.Text, nullable=False)
-    data_publicacao = db.Column(db.DateTime, default=datetime.utcnow)
+    data_publicacao = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     imagem = db.Column(db.String(100))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -68,18 +185,87 @@ class Promocao(db.Model): # Novo modelo para anúncios/afiliados
     imagem = db.Column(db.String(100))
     tipo = db.Column(db.String(50), nullable=False) # 'corrida_promovida' ou 'afiliado'
     ativo = db.Column(db.Boolean, default=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
 class Acesso(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    pagina = db.Column(db.String(50), nullable=False)
-    data = db.Column(db.DateTime, default=datetime.utcnow)
+    pagina = db.Column(db.String(50), nullable=False, index=True)
+    data = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     ip = db.Column(db.String(45))
 
+# Totais de acessos por página, somados a cada lote gravado pela FilaAcessos.
+# Os painéis consultam só estas tabelas, que crescem com o número de
+# páginas e não com o de acessos.
+class AcessoHora(db.Model):
+    hora = db.Column(db.DateTime, primary_key=True)
+    pagina = db.Column(db.String(50), primary_key=True)
+    total = db.Column(db.Integer, nullable=False, default=0)
+
+class AcessoDia(db.Model):
+    dia = db.Column(db.Date, primary_key=True)
+    pagina = db.Column(db.String(50), primary_key=True)
+    total = db.Column(db.Integer, nullable=False, default=0)
+
+class TarefaImportacao(db.Model): # Importação de imagens em segundo plano
+    id = db.Column(db.String(32), primary_key=True)
+    status = db.Column(db.String(20), nullable=False, default='na_fila') # na_fila, processando, concluida, erro
+    total = db.Column(db.Integer, default=0)
+    processadas = db.Column(db.Integer, default=0)
+    ignoradas = db.Column(db.Integer, default=0)
+    erros = db.Column(db.Text, default='')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def progresso(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'total': self.total,
+            'processadas': self.processadas,
+            'ignoradas': self.ignoradas,
+            'erros': [erro for erro in (self.erros or '').split('\n') if erro],
+        }
+
+# Pasta de uploads -> modelo que guarda o nome da imagem
+MODELOS_IMAGEM = {'corridas': Corrida, 'blog': Post, 'promocoes': Promocao}
+
+class CacheUsuarios:
+    # O Flask-Login carrega o usuário em toda requisição autenticada; aqui
+    # ele fica guardado por `validade` segundos, já fora da sessão do
+    # SQLAlchemy (só leitura: nenhuma rota altera o usuário logado).
+
+    def __init__(self, validade=60, maximo=100):
+        self.validade = validade
+        self.maximo = maximo
+        self._usuarios = {}  # id -> (expira_em, usuario)
+        self._trava = threading.Lock()
+
+    def obter(self, user_id):
+        agora = time.monotonic()
+        with self._trava:
+            guardado = self._usuarios.get(user_id)
+        if guardado is not None and guardado[0] > agora:
+            return guardado[1]
+        usuario = db.session.get(Usuario, user_id)
+        if usuario is not None:
+            db.session.expunge(usuario)
+            with self._trava:
+                if len(self._usuarios) >= self.maximo:
+                    self._usuarios = {chave: valor for chave, valor in self._usuarios.items()
+                                      if valor[0] > agora}
+                self._usuarios[user_id] = (agora + self.validade, usuario)
+        return usuario
+
+    def descartar(self, user_id):
+        with self._trava:
+            self._usuarios.pop(user_id, None)
+
+cache_usuarios = CacheUsuarios(app.config['CACHE_USUARIO_SEGUNDOS'])
+
 # --- Callbacks do Flask-Login ---
 @login_manager.user_loader
 def load_user(user_id):
-    return Usuario.query.get(int(user_id))
+    return cache_usuarios.obter(int(user_id))
 
 # --- Rotas de Autenticação ---
 @app.route('/login', methods=['GET', 'POST'])
@@ -106,6 +292,7 @@ def login():
 @app.route('/logout')
 @login_required
 def logout():
+    cache_usuarios.descartar(current_user.id)
     logout_user()
     flash('Você saiu da sua conta.', 'info')
     return redirect(url_for('index'))
@@ -125,36 +312,477 @@ def setup_admin():
     return redirect(url_for('login'))
 
 # --- Funções Auxiliares e Before Request ---
+def somar_acessos(contagem_hora):
+    # contagem_hora: {(hora, pagina): total}. Soma nas duas tabelas de
+    # totais com INSERT ... ON CONFLICT, na transação de quem chamou.
+    contagem_dia = {}
+    for (hora, pagina), total in contagem_hora.items():
+        chave = (hora.date(), pagina)
+        contagem_dia[chave] = contagem_dia.get(chave, 0) + total
+    for modelo, coluna, contagem in ((AcessoHora, 'hora', contagem_hora), (AcessoDia, 'dia', contagem_dia)):
+        if not contagem:
+            continue
+        comando = sqlite_insert(modelo.__table__)
+        db.session.execute(
+            comando.on_conflict_do_update(
+                index_elements=[coluna, 'pagina'],
+                set_={'total': modelo.__table__.c.total + comando.excluded.total}),
+            [{coluna: momento, 'pagina': pagina, 'total': total}
+             for (momento, pagina), total in contagem.items()])
+
+def consolidar_acessos_antigos():
+    # Uma única vez, em bancos que já tinham acessos antes das tabelas de
+    # totais: soma os acessos existentes por hora e página
+    if AcessoHora.query.first() is not None or Acesso.query.first() is None:
+        return
+    hora = func.strftime('%Y-%m-%d %H:00:00', Acesso.data)
+    contagem = {
+        (datetime.strptime(momento, '%Y-%m-%d %H:%M:%S'), pagina): total
+        for momento, pagina, total in db.session.query(hora, Acesso.pagina, func.count(Acesso.id))
+            .filter(Acesso.data.isnot(None)).group_by(hora, Acesso.pagina)
+    }
+    somar_acessos(contagem)
+    db.session.commit()
+
+def podar_acessos():
+    # Retenção: apaga acessos individuais e totais por hora antigos; os
+    # totais por dia continuam valendo para o histórico
+    agora = datetime.utcnow()
+    Acesso.query.filter(
+        Acesso.data < agora - timedelta(days=app.config['RETENCAO_ACESSOS_DIAS'])
+    ).delete(synchronize_session=False)
+    AcessoHora.query.filter(
+        AcessoHora.hora < agora - timedelta(days=app.config['RETENCAO_ACESSOS_HORA_DIAS'])
+    ).delete(synchronize_session=False)
+    db.session.commit()
+
+def resumo_acessos():
+    # Totais dos painéis em uma única consulta (uma subconsulta por total)
+    inicio_hoje = datetime.combine(datetime.today().date(), datetime.min.time())
+    totais = db.session.execute(select(
+        select(func.coalesce(func.sum(AcessoDia.total), 0)).scalar_subquery().label('total_acessos'),
+        select(func.coalesce(func.sum(AcessoHora.total), 0))
+            .where(AcessoHora.hora >= inicio_hoje).scalar_subquery().label('acessos_hoje'),
+        select(func.count(Corrida.id)).scalar_subquery().label('total_corridas'),
+        select(func.count(Post.id)).scalar_subquery().label('total_posts'),
+    )).one()
+    return totais._asdict()
+
+class FilaAcessos:
+    # Os acessos entram em uma fila em memória e uma thread grava em lotes
+    # (a cada `lote` acessos ou `intervalo` segundos), em uma única
+    # transação. A requisição nunca espera o disco. Com a fila cheia o
+    # acesso é descartado e contado, em vez de segurar a página.
+
+    def __init__(self, maximo=10000, lote=500, intervalo=1.0, intervalo_poda=3600):
+        self.lote = lote
+        self.intervalo = intervalo
+        self.intervalo_poda = intervalo_poda
+        self._ultima_poda = time.monotonic()
+        self._fila = queue.Queue(maxsize=maximo)
+        self._trava = threading.Lock()
+        self._thread = None
+        self.gravados = 0
+        self.descartados = 0
+        self.falhas = 0
+
+    def registrar(self, pagina, ip):
+        if self._thread is None:
+            self._iniciar()
+        try:
+            self._fila.put_nowait({'pagina': pagina, 'ip': ip, 'data': datetime.utcnow()})
+        except queue.Full:
+            self.descartados += 1
+
+    def _iniciar(self):
+        # Criada no primeiro acesso, já dentro do worker
+        with self._trava:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._executar, daemon=True)
+                self._thread.start()
+                atexit.register(self.esvaziar)
+
+    def _proximo_lote(self):
+        acessos = [self._fila.get()]
+        limite = time.monotonic() + self.intervalo
+        while len(acessos) < self.lote:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                acessos.append(self._fila.get(timeout=restante))
+            except queue.Empty:
+                break
+        return acessos
+
+    def _gravar(self, acessos):
+        with app.app_context():
+            try:
+                contagem = {}
+                for acesso in acessos:
+                    chave = (acesso['data'].replace(minute=0, second=0, microsecond=0), acesso['pagina'])
+                    contagem[chave] = contagem.get(chave, 0) + 1
+                db.session.execute(Acesso.__table__.insert(), acessos)
+                somar_acessos(contagem)
+                db.session.commit()
+                self.gravados += len(acessos)
+            except Exception as e:
+                db.session.rollback()
+                self.falhas += len(acessos)
+                print(f'Erro ao gravar {len(acessos)} acessos: {e}')
+
+    def _executar(self):
+        while True:
+            self._gravar(self._proximo_lote())
+            if time.monotonic() - self._ultima_poda >= self.intervalo_poda:
+                self._ultima_poda = time.monotonic()
+                with app.app_context():
+                    try:
+                        podar_acessos()
+                    except Exception as e:
+                        db.session.rollback()
+                        print(f'Erro ao podar acessos: {e}')
+
+    def esvaziar(self):
+        # Grava o que ainda está na fila (usado ao encerrar o processo)
+        acessos = []
+        while True:
+            try:
+                acessos.append(self._fila.get_nowait())
+            except queue.Empty:
+                break
+        if acessos:
+            self._gravar(acessos)
+
+    def estado(self):
+        return {'pendentes': self._fila.qsize(), 'gravados': self.gravados,
+                'descartados': self.descartados, 'falhas': self.falhas}
+
+fila_acessos = FilaAcessos()
+
 @app.before_request
 def registrar_acesso():
-    if not request.path.startswith('/uploads/'):
-        acesso = Acesso(
-            pagina=request.endpoint or 'unknown',
-            ip=request.remote_addr
-        )
-        db.session.add(acesso)
-        db.session.commit()
+    if not request.path.startswith('/uploads/') and request.endpoint != 'metricas':
+        fila_acessos.registrar(request.endpoint or 'unknown', request.remote_addr)
 
 def save_image(file, folder):
+    # Grava o original com nome pelo conteúdo (<pasta>_<hash>.<ext>) e manda
+    # gerar as variantes (mini, card, full em WebP e JPEG) no pool de
+    # processos; a requisição não espera. Até as variantes ficarem prontas,
+    # imagem_url() devolve o original.
     if file and allowed_file(file.filename, app.config['ALLOWED_EXTENSIONS']):
         extension = file.filename.rsplit('.', 1)[1].lower()
-        filename = f"{folder}_{datetime.now().strftime('%Y%m%d%H%M%S')}.{extension}"
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], folder, filename)
-        file.save(file_path)
+        dados = file.read()
+        filename = nome_com_hash(dados, folder, extension)
+        pasta = os.path.join(app.config['UPLOAD_FOLDER'], folder)
+        os.makedirs(pasta, exist_ok=True)
+        file_path = os.path.join(pasta, filename)
+        if not os.path.exists(file_path):
+            with escrita_atomica(file_path, modo='wb') as arquivo:
+                arquivo.write(dados)
+        pool_imagens().submit(gerar_variantes, pasta, filename).add_done_callback(_avisar_erro_variantes)
         return filename
     return None
 
+def _avisar_erro_variantes(futuro):
+    if futuro.exception() is not None:
+        print(f'Erro ao gerar variantes de imagem: {futuro.exception()}')
+
 def delete_image(filename, folder):
     if filename:
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], folder, filename)
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        # Com nomes pelo conteúdo, o mesmo arquivo pode estar em outro registro
+        modelo = MODELOS_IMAGEM.get(folder)
+        if modelo is not None and modelo.query.filter_by(imagem=filename).count() > 1:
+            return
+        for nome in [filename] + nomes_variantes(filename):
+            _variantes_prontas.discard((folder, nome))
+            file_path = os.path.join(app.config['UPLOAD_FOLDER'], folder, nome)
+            if os.path.exists(file_path):
+                os.remove(file_path)
 
-# --- Rotas de Visualização (Públicas) ---
-@app.route('/')
-def index():
-    corridas_proximas = Corrida.query.filter(Corrida.data >= datetime.now()).order_by(Corrida.data.asc()).all()
-    promocoes_ativas = Promocao.query.filter_by(ativo=True).all()
+# Variantes já vistas em disco, para não dar stat a cada imagem renderizada
+_variantes_prontas = set()
+
+def _variante_pronta(folder, nome):
+    if (folder, nome) in _variantes_prontas:
+        return True
+    if os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], folder, nome)):
+        _variantes_prontas.add((folder, nome))
+        return True
+    return False
+
+# Uploads e static servidos com o hash do conteúdo na URL (?v=...) e cache
+# imutável no navegador; sem o hash, o navegador revalida pelo ETag
+ativos_uploads = {folder: Ativos(os.path.join(app.config['UPLOAD_FOLDER'], folder), f'upload_{folder}')
+                  for folder in ('corridas', 'blog', 'promocoes')}
+ativos_estaticos = Ativos(app.static_folder, 'static')
+app.view_functions['static'] = ativos_estaticos.servir
+app.add_template_global(ativos_estaticos.url, 'ativo')
+
+@app.template_global()
+def upload_url(folder, filename):
+    return ativos_uploads[folder].url(filename)
+
+@app.template_global()
+def imagem_url(folder, filename, variante='card', formato='webp'):
+    # Nos templates: <img src="{{ imagem_url('corridas', corrida.imagem, 'card') }}">
+    if not filename:
+        return None
+    nome = nome_variante(filename, variante, formato)
+    if _variante_pronta(folder, nome):
+        filename = nome
+    return upload_url(folder, filename)
+
+@app.template_global()
+def imagem_srcset(folder, filename, formato='webp'):
+    # srcset com as variantes prontas, para o navegador escolher pelo tamanho da tela
+    if not filename:
+        return ''
+    return ', '.join(
+        f"{upload_url(folder, nome_variante(filename, variante, formato))} {lado}w"
+        for variante, lado in VARIANTES.items()
+        if _variante_pronta(folder, nome_variante(filename, variante, formato)))
+
+def deduplicar_corridas():
+    # Bancos de antes do índice único (nome, data): deixa só a corrida mais
+    # recente de cada chave, com a imagem de uma das repetidas se ela não
+    # tiver, e remove o índice antigo para criar_indices() criar o único
+    with db.engine.begin() as conexao:
+        indices = {linha[1]: linha[2] for linha in conexao.exec_driver_sql('PRAGMA index_list(corrida)')}
+        if indices.get('ix_corrida_nome_data'):
+            return
+        conexao.exec_driver_sql('''
+            UPDATE corrida SET imagem = (
+                SELECT outra.imagem FROM corrida AS outra
+                WHERE outra.nome = corrida.nome AND outra.data = corrida.data
+                  AND outra.imagem IS NOT NULL
+                ORDER BY outra.id DESC LIMIT 1)
+            WHERE imagem IS NULL''')
+        conexao.exec_driver_sql('''
+            DELETE FROM corrida WHERE id NOT IN (
+                SELECT MAX(id) FROM corrida GROUP BY nome, data)''')
+        conexao.exec_driver_sql('DROP INDEX IF EXISTS ix_corrida_nome_data')
+
+def criar_indices():
+    # create_all() não cria índices em tabelas que já existem
+    for tabela in db.metadata.sorted_tables:
+        for indice in tabela.indexes:
+            indice.create(bind=db.engine, checkfirst=True)
+
+# --- Importação de corridas (CSV) ---
+FORMATOS_DATA_CSV = ['%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%dT%H:%M', '%d/%m/%Y %H:%M']
+CAMPOS_CORRIDA_CSV = ['nome', 'data', 'local', 'valor', 'distancia']
+
+class LinhaCorridaInvalida(ValueError):
+    pass
+
+def _numero_csv(valor, campo):
+    try:
+        return float(valor.strip().replace(',', '.'))
+    except ValueError:
+        raise LinhaCorridaInvalida(f'{campo} inválido: {valor!r}')
+
+def _data_csv(valor):
+    for formato in FORMATOS_DATA_CSV:
+        try:
+            return datetime.strptime(valor.strip(), formato)
+        except ValueError:
+            pass
+    raise LinhaCorridaInvalida(f'data inválida: {valor!r}')
+
+def corrida_do_csv(row):
+    # Converte uma linha do CSV nos campos de Corrida
+    faltando = [campo for campo in CAMPOS_CORRIDA_CSV if not (row.get(campo) or '').strip()]
+    if faltando:
+        raise LinhaCorridaInvalida(f'campos em branco: {", ".join(faltando)}')
+    campos = {
+        'nome': row['nome'].strip(),
+        'data': _data_csv(row['data']),
+        'local': row['local'].strip(),
+        'valor': _numero_csv(row['valor'], 'valor'),
+        'distancia': _numero_csv(row['distancia'], 'distancia'),
+        'descricao': row.get('descricao') or '',
+        'promovida': (row.get('promovida') or 'false').strip().lower() in ('true', '1', 'on'),
+    }
+    # Sem imagem no CSV não apaga a que já existe (pode ter vindo do ZIP)
+    if (row.get('imagem') or '').strip():
+        campos['imagem'] = row['imagem'].strip()
+    return campos
+
+def _gravar_lote_corridas(lote):
+    # Upsert pela chave natural (nome, data) com INSERT ... ON CONFLICT no
+    # índice único ix_corrida_nome_data: duas importações ao mesmo tempo não
+    # duplicam corridas. Linhas repetidas no lote são aplicadas em ordem, e
+    # uma linha sem imagem não apaga a imagem que já existe.
+    existentes = {
+        (nome, data)
+        for nome, data in db.session.query(Corrida.nome, Corrida.data)
+            .filter(Corrida.nome.in_({campos['nome'] for campos in lote}))
+    }
+    novas = atualizadas = 0
+    for campos in lote:
+        chave = (campos['nome'], campos['data'])
+        if chave in existentes:
+            atualizadas += 1
+        else:
+            existentes.add(chave)
+            novas += 1
+    tabela = Corrida.__table__
+    comando = sqlite_insert(tabela)
+    db.session.execute(
+        comando.on_conflict_do_update(
+            index_elements=['nome', 'data'],
+            set_={**{coluna: comando.excluded[coluna]
+                     for coluna in ('local', 'valor', 'distancia', 'descricao', 'promovida')},
+                  'imagem': func.coalesce(comando.excluded.imagem, tabela.c.imagem)}),
+        [dict({'imagem': None}, **campos) for campos in lote])
+    # As contagens vêm da consulta acima: com outra importação simultânea
+    # podem trocar inseridas por atualizadas, mas nunca duplicar linhas
+    return novas, atualizadas
+
+def importar_csv_corridas(arquivo, tamanho_lote=500, maximo_erros=100):
+    # Lê o CSV direto do upload, sem carregar tudo em memória, e grava em
+    # lotes dentro de uma única transação. Linhas inválidas não interrompem
+    # a importação: vão para a lista de erros com o número da linha.
+    texto = io.TextIOWrapper(arquivo, encoding='utf-8-sig', newline='')
+    inseridas = atualizadas = invalidas = 0
+    erros, lote = [], []
+    try:
+        for numero, row in enumerate(csv.DictReader(texto, delimiter=','), start=2):
+            try:
+                lote.append(corrida_do_csv(row))
+            except LinhaCorridaInvalida as e:
+                invalidas += 1
+                if len(erros) < maximo_erros:
+                    erros.append({'linha': numero, 'erro': str(e)})
+            if len(lote) >= tamanho_lote:
+                novas, alteradas = _gravar_lote_corridas(lote)
+                inseridas, atualizadas, lote = inseridas + novas, atualizadas + alteradas, []
+        if lote:
+            novas, alteradas = _gravar_lote_corridas(lote)
+            inseridas, atualizadas = inseridas + novas, atualizadas + alteradas
+        db.session.commit()
+        feed.invalidar()
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        texto.detach()
+    return {'inseridas': inseridas, 'atualizadas': atualizadas, 'invalidas': invalidas, 'erros': erros}
+
+# --- Importação de imagens em ZIP ---
+_pool_imagens = None
+_trava_pool = threading.Lock()
+
+if not PILLOW:
+    # Avisado aqui, e não no imagens.py, que é importado de novo em cada processo do pool
+    app.logger.warning('Pillow não está instalado: as imagens serão gravadas como vieram, '
+                       'sem reduzir e sem variantes (pip install Pillow)')
+
+def pool_imagens():
+    # Criado sob demanda. 'spawn' porque o worker já tem threads rodando e
+    # os processos filhos só precisam importar o imagens.py
+    global _pool_imagens
+    with _trava_pool:
+        if _pool_imagens is None:
+            _pool_imagens = ProcessPoolExecutor(
+                max_workers=app.config['PROCESSOS_IMAGENS'],
+                mp_context=multiprocessing.get_context('spawn'))
+        return _pool_imagens
+
+def iniciar_importacao_imagens(file_zip):
+    # Guarda o ZIP em disco e processa em uma thread; a requisição volta na hora
+    pasta_tmp = os.path.join(app.config['UPLOAD_FOLDER'], 'tmp')
+    os.makedirs(pasta_tmp, exist_ok=True)
+    descritor, caminho_zip = tempfile.mkstemp(dir=pasta_tmp, suffix='.zip')
+    os.close(descritor)
+    file_zip.save(caminho_zip)
+
+    tarefa = TarefaImportacao(id=uuid.uuid4().hex)
+    db.session.add(tarefa)
+    db.session.commit()
+    threading.Thread(target=importar_imagens_zip, args=(tarefa.id, caminho_zip),
+                     daemon=True).start()
+    return tarefa
+
+def importar_imagens_zip(tarefa_id, caminho_zip):
+    # Lê o ZIP um membro por vez (só a imagem atual e as que estão no pool
+    # ficam em memória) e associa cada arquivo às corridas cujo campo
+    # `imagem` tem o mesmo nome, sem diferenciar maiúsculas.
+    with app.app_context():
+        tarefa = db.session.get(TarefaImportacao, tarefa_id)
+        try:
+            pasta = os.path.join(app.config['UPLOAD_FOLDER'], 'corridas')
+            os.makedirs(pasta, exist_ok=True)
+
+            por_imagem = {}
+            for corrida_id, imagem in db.session.query(Corrida.id, Corrida.imagem).filter(Corrida.imagem.isnot(None)):
+                por_imagem.setdefault(os.path.basename(imagem).lower(), []).append(corrida_id)
+
+            with zipfile.ZipFile(caminho_zip) as arquivo_zip:
+                membros = [membro for membro in arquivo_zip.infolist()
+                           if not membro.is_dir()
+                           and not membro.filename.startswith('__MACOSX/')
+                           and not os.path.basename(membro.filename).startswith('.')
+                           and allowed_file(membro.filename, app.config['ALLOWED_EXTENSIONS'])]
+                tarefa.status = 'processando'
+                tarefa.total = len(membros)
+                db.session.commit()
+
+                erros = []
+                pendentes = {}
+                limite_pendentes = 2 * app.config['PROCESSOS_IMAGENS']
+
+                def concluir(futuros):
+                    for futuro in futuros:
+                        nome, ids = pendentes.pop(futuro)
+                        try:
+                            resultado = futuro.result()
+                        except Exception as e:
+                            erros.append(f'{nome}: {e}')
+                            continue
+                        Corrida.query.filter(Corrida.id.in_(ids)).update(
+                            {Corrida.imagem: resultado['imagem']}, synchronize_session=False)
+                        tarefa.processadas += 1
+                    tarefa.erros = '\n'.join(erros)
+                    db.session.commit()
+
+                for membro in membros:
+                    nome = os.path.basename(membro.filename)
+                    ids = por_imagem.get(nome.lower())
+                    if not ids:
+                        tarefa.ignoradas += 1
+                        continue
+                    if membro.file_size > app.config['MAX_IMAGEM_ZIP']:
+                        erros.append(f'{nome}: arquivo muito grande')
+                        continue
+                    futuro = pool_imagens().submit(
+                        processar_imagem, arquivo_zip.read(membro), pasta, secure_filename(nome))
+                    pendentes[futuro] = (nome, ids)
+                    if len(pendentes) >= limite_pendentes:
+                        prontos, _ = wait(pendentes, return_when=FIRST_COMPLETED)
+                        concluir(prontos)
+                concluir(list(pendentes))
+
+            tarefa.status = 'concluida'
+            db.session.commit()
+            feed.invalidar()
+        except Exception as e:
+            db.session.rollback()
+            tarefa.status = 'erro'
+            tarefa.erros = '\n'.join(filter(None, [tarefa.erros, str(e)]))
+            db.session.commit()
+        finally:
+            os.remove(caminho_zip)
+
+# --- Feed da página inicial ---
+def _copia(objeto):
+    # Cópia só com as colunas, que pode ficar em cache fora da sessão
+    return SimpleNamespace(**{coluna.key: getattr(objeto, coluna.key) for coluna in objeto.__table__.columns})
+
+def montar_feed(agora):
+    corridas_proximas = [_copia(c) for c in Corrida.query.filter(Corrida.data >= agora).order_by(Corrida.data.asc()).all()]
+    promocoes_ativas = [_copia(p) for p in Promocao.query.filter_by(ativo=True).all()]
     
     # Lógica para intercalar corridas e promoções
     lista_principal = []
@@ -183,9 +811,165 @@ def index():
         if idx_promocao < len(promocoes_ativas):
             lista_principal.append({'tipo': 'promocao', 'item': promocoes_ativas[idx_promocao]})
             idx_promocao += 1
-    
-    # Passa a lista intercalada para o template
-    return render_template('index.html', lista_principal=lista_principal)
+
+    # O feed muda sozinho quando a próxima corrida começa
+    valido_ate = corridas_proximas[0].data if corridas_proximas else None
+    ultima_iniciada = db.session.query(func.max(Corrida.data)).filter(Corrida.data < agora).scalar()
+    return lista_principal, valido_ate, ultima_iniciada
+
+class CacheFeed:
+    # Feed intercalado da página inicial, calculado uma vez por versão dos
+    # dados. A versão é o arquivo `arquivo_versao`, trocado por invalidar()
+    # a cada alteração nas rotas de admin; como a troca é um os.replace,
+    # (inode, mtime) muda em todos os workers e basta um stat por acesso.
+
+    def __init__(self, arquivo_versao):
+        self.arquivo_versao = arquivo_versao
+        self._trava = threading.Lock()
+        self._cache = None # (versão, válido até, feed, etag, última modificação)
+
+    def versao(self):
+        try:
+            info = os.stat(self.arquivo_versao)
+        except FileNotFoundError:
+            return (0, 0)
+        return (info.st_ino, info.st_mtime_ns)
+
+    def invalidar(self):
+        with travado(self.arquivo_versao), escrita_atomica(self.arquivo_versao, sincronizar=False) as arquivo:
+            arquivo.write(f'{time.time()}\n')
+
+    def obter(self):
+        # Retorna (feed, etag, última modificação em UTC)
+        agora = datetime.now()
+        versao = self.versao()
+        if versao == (0, 0):
+            self.invalidar()
+            versao = self.versao()
+        cache = self._cache
+        if cache is None or cache[0] != versao or (cache[1] is not None and agora > cache[1]):
+            with self._trava:
+                cache = self._cache
+                if cache is None or cache[0] != versao or (cache[1] is not None and agora > cache[1]):
+                    feed, valido_ate, ultima_iniciada = montar_feed(agora)
+                    etag = hashlib.sha1(repr((versao, valido_ate)).encode()).hexdigest()
+                    # Última mudança: a última alteração pelo admin ou a última corrida que saiu do feed
+                    modificado = [datetime.fromtimestamp(versao[1] / 1e9, timezone.utc)]
+                    if ultima_iniciada is not None:
+                        modificado.append(ultima_iniciada.astimezone(timezone.utc))
+                    cache = self._cache = (versao, valido_ate, feed, etag, max(modificado).replace(microsecond=0))
+        return cache[2], cache[3], cache[4]
+
+feed = CacheFeed(app.config['ARQUIVO_VERSAO_FEED'])
+
+def item_feed_json(entrada):
+    # Corridas promovidas entram no feed sem o envelope {'tipo', 'item'}
+    if isinstance(entrada, dict):
+        return {'tipo': entrada['tipo'], 'item': vars(entrada['item'])}
+    return {'tipo': 'corrida', 'item': vars(entrada)}
+
+# --- Paginação por cursor ---
+# Em vez de OFFSET, cada página começa depois do último item da anterior,
+# pela coluna de ordenação e o id (desempate). Com o índice da coluna a
+# consulta custa o mesmo na primeira e na milésima página.
+def codificar_cursor(valor, item_id):
+    # Sem valor (coluna NULL) o cursor fica só com o id: "|<id>"
+    texto = f'{valor.isoformat() if valor is not None else ""}|{item_id}'
+    return base64.urlsafe_b64encode(texto.encode()).decode().rstrip('=')
+
+def decodificar_cursor(cursor):
+    try:
+        texto = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        valor, item_id = texto.rsplit('|', 1)
+        return (datetime.fromisoformat(valor) if valor else None), int(item_id)
+    except ValueError:
+        abort(400, 'Cursor de paginação inválido')
+
+def paginar(query, modelo, coluna, descendente=False, cursor=None, por_pagina=None):
+    # Retorna (itens, cursor da próxima página ou None). As linhas com a
+    # coluna NULL vêm por último, nos dois sentidos, ordenadas só pelo id.
+    por_pagina = por_pagina or app.config['ITENS_POR_PAGINA']
+    chave = tuple_(coluna, modelo.id)
+    if cursor:
+        valor, item_id = decodificar_cursor(cursor)
+        if valor is None:
+            query = query.filter(coluna.is_(None),
+                                 modelo.id < item_id if descendente else modelo.id > item_id)
+        else:
+            query = query.filter(or_(
+                chave < (valor, item_id) if descendente else chave > (valor, item_id),
+                coluna.is_(None)))
+    if descendente:
+        query = query.order_by(coluna.desc().nullslast(), modelo.id.desc())
+    else:
+        query = query.order_by(coluna.asc().nullslast(), modelo.id.asc())
+    itens = query.limit(por_pagina + 1).all()
+    proximo = None
+    if len(itens) > por_pagina:
+        itens = itens[:por_pagina]
+        proximo = codificar_cursor(getattr(itens[-1], coluna.key), itens[-1].id)
+    return itens, proximo
+
+def _limite_pagina():
+    return min(max(request.args.get('limite', app.config['ITENS_POR_PAGINA'], type=int), 1), 100)
+
+# Listagens da API: (modelo, coluna de ordenação, decrescente, pública)
+LISTAGENS = {
+    'corridas': (Corrida, Corrida.data, False, True),
+    'posts': (Post, Post.data_publicacao, True, True),
+    'promocoes': (Promocao, Promocao.created_at, True, False),
+}
+
+@app.route('/api/<listagem>')
+def api_listagem(listagem):
+    if listagem not in LISTAGENS:
+        abort(404)
+    modelo, coluna, descendente, publica = LISTAGENS[listagem]
+    if not publica and not current_user.is_authenticated:
+        abort(401)
+    itens, proximo = paginar(modelo.query, modelo, coluna, descendente,
+                             request.args.get('depois'), _limite_pagina())
+    return jsonify({
+        'itens': [vars(_copia(item)) for item in itens],
+        'proximo': proximo,
+        'proxima_url': url_for('api_listagem', listagem=listagem, depois=proximo) if proximo else None,
+    })
+
+# --- Rotas de Visualização (Públicas) ---
+@app.route('/')
+def index():
+    lista, etag, modificado = feed.obter()
+
+    por_pagina = app.config['ITENS_POR_PAGINA']
+    total_paginas = max(1, -(-len(lista) // por_pagina))
+    pagina = min(max(request.args.get('pagina', 1, type=int), 1), total_paginas)
+    formato_json = request.accept_mimetypes.best == 'application/json'
+
+    # A página muda com o login (menu do admin) e com mensagens de flash;
+    # com mensagens pendentes não responde 304 para não engoli-las
+    etag = f'{etag}-{pagina}-{int(current_user.is_authenticated)}-{int(formato_json)}'
+    condicional = formato_json or '_flashes' not in session
+    if condicional and (request.if_none_match.contains(etag) or (
+            not request.if_none_match and request.if_modified_since
+            and request.if_modified_since >= modificado)):
+        resposta = app.response_class(status=304)
+    else:
+        lista_principal = lista[(pagina - 1) * por_pagina:pagina * por_pagina]
+        if formato_json:
+            resposta = jsonify({'itens': [item_feed_json(entrada) for entrada in lista_principal],
+                                'pagina': pagina, 'total_paginas': total_paginas,
+                                'proxima_pagina': pagina + 1 if pagina < total_paginas else None})
+        else:
+            # Passa a lista intercalada para o template
+            resposta = app.make_response(render_template(
+                'index.html', lista_principal=lista_principal, pagina=pagina,
+                total_paginas=total_paginas))
+    if condicional:
+        resposta.set_etag(etag)
+        resposta.last_modified = modificado
+        resposta.headers['Cache-Control'] = 'private, no-cache'
+    resposta.vary.add('Accept')
+    return resposta
 
 @app.route('/corrida/<int:id>')
 def corrida_detalhes(id):
@@ -194,8 +978,9 @@ def corrida_detalhes(id):
 
 @app.route('/blog')
 def blog():
-    posts = Post.query.order_by(Post.data_publicacao.desc()).all()
-    return render_template('blog/index.html', posts=posts)
+    posts, proximo = paginar(Post.query, Post, Post.data_publicacao, descendente=True,
+                             cursor=request.args.get('depois'), por_pagina=_limite_pagina())
+    return render_template('blog/index.html', posts=posts, proximo_cursor=proximo)
 
 @app.route('/blog/post/<int:id>')
 def post_detalhes(id):
@@ -216,39 +1001,36 @@ def privacidade():
 
 @app.route('/uploads/corridas/<filename>')
 def upload_corridas(filename):
-    return send_from_directory('uploads/corridas', filename)
+    return ativos_uploads['corridas'].servir(filename)
 
 @app.route('/uploads/blog/<filename>')
 def upload_blog(filename):
-    return send_from_directory('uploads/blog', filename)
+    return ativos_uploads['blog'].servir(filename)
 
 @app.route('/uploads/promocoes/<filename>')
 def upload_promocoes(filename):
-    return send_from_directory('uploads/promocoes', filename)
+    return ativos_uploads['promocoes'].servir(filename)
 
 
 # --- Rotas de Admin (Protegidas) ---
 @app.route('/admin')
 @login_required
 def admin():
-    total_acessos = Acesso.query.count()
-    total_corridas = Corrida.query.count()
-    total_posts = Post.query.count()
-    acessos_hoje = Acesso.query.filter(
-        Acesso.data >= datetime.today().date()
-    ).count()
+    acessos = resumo_acessos()
     return render_template('admin/index.html', 
-                         total_acessos=total_acessos,
-                         total_corridas=total_corridas,
-                         total_posts=total_posts,
-                         acessos_hoje=acessos_hoje)
+                         total_acessos=acessos['total_acessos'],
+                         total_corridas=acessos['total_corridas'],
+                         total_posts=acessos['total_posts'],
+                         acessos_hoje=acessos['acessos_hoje'],
+                         fila_acessos=fila_acessos.estado())
 
 # --- Admin: Corridas ---
 @app.route('/admin/corridas')
 @login_required
 def admin_corridas():
-    corridas = Corrida.query.order_by(Corrida.data.asc()).all()
-    return render_template('admin/corridas.html', corridas=corridas)
+    corridas, proximo = paginar(Corrida.query, Corrida, Corrida.data,
+                                cursor=request.args.get('depois'), por_pagina=_limite_pagina())
+    return render_template('admin/corridas.html', corridas=corridas, proximo_cursor=proximo)
 
 @app.route('/admin/corrida/nova', methods=['GET', 'POST'])
 @login_required
@@ -274,6 +1056,7 @@ def nova_corrida():
             
             db.session.add(corrida)
             db.session.commit()
+            feed.invalidar()
             flash('Corrida adicionada com sucesso!', 'success')
             return redirect(url_for('admin_corridas'))
         except Exception as e:
@@ -286,54 +1069,50 @@ def nova_corrida():
 def importar_corridas():
     if request.method == 'POST':
         # 1. Processar CSV
+        relatorio = None
         if 'csv' in request.files:
             file_csv = request.files['csv']
             if file_csv.filename != '' and file_csv.filename.endswith('.csv'):
                 try:
-                    stream = StringIO(file_csv.stream.read().decode("UTF8"), newline=None)
-                    csv_reader = csv.DictReader(stream, delimiter=',')
-                    corridas_adicionadas = 0
-                    
-                    for row in csv_reader:
-                        # Adapte o formato da data se necessário, mas mantenha o '%Y-%m-%d %H:%M:%S'
-                        # Adicionando um fallback simples para imagem e promovida
-                        promovida_val = row.get('promovida', 'false').lower() in ('true', '1', 'on')
-                        
-                        corrida = Corrida(
-                            nome=row['nome'],
-                            data=datetime.strptime(row['data'], '%Y-%m-%d %H:%M:%S'),
-                            local=row['local'],
-                            valor=float(row['valor']),
-                            distancia=float(row['distancia']),
-                            descricao=row.get('descricao', ''),
-                            imagem=row.get('imagem', None), # Assume que a imagem já foi enviada ou será enviada via ZIP
-                            promovida=promovida_val
-                        )
-                        db.session.add(corrida)
-                        corridas_adicionadas += 1
-                    
-                    db.session.commit()
-                    flash(f'{corridas_adicionadas} corridas do CSV importadas com sucesso! (Verifique as imagens)', 'success')
+                    relatorio = importar_csv_corridas(file_csv.stream)
+                    flash(f"{relatorio['inseridas']} corridas do CSV importadas e "
+                          f"{relatorio['atualizadas']} atualizadas! (Verifique as imagens)", 'success')
+                    if relatorio['invalidas']:
+                        detalhes = '; '.join(f"linha {erro['linha']}: {erro['erro']}"
+                                             for erro in relatorio['erros'][:10])
+                        flash(f"{relatorio['invalidas']} linhas ignoradas. {detalhes}", 'warning')
                 except Exception as e:
                     flash(f'Erro ao importar CSV: {str(e)}', 'error')
             else:
                 flash('Por favor, envie um arquivo CSV válido', 'error')
 
-        # 2. Processar Imagens em ZIP (apenas a lógica inicial de upload)
+        # 2. Processar Imagens em ZIP (em segundo plano, depois do CSV)
+        tarefa = None
         if 'imagens_zip' in request.files:
             file_zip = request.files['imagens_zip']
-            if file_zip.filename != '' and file_zip.filename.endswith('.zip'):
-                # LÓGICA DE EXTRAÇÃO E MATCH DE IMAGENS POR NOME AQUI
-                # Por exemplo: extrair para 'uploads/corridas/' e garantir que o nome da imagem
-                # no CSV corresponda ao nome do arquivo no ZIP.
-                flash('Arquivo ZIP enviado. A lógica de extração e associação de imagens por ZIP precisa ser implementada.', 'warning')
+            if file_zip.filename != '' and allowed_file(file_zip.filename, app.config['ALLOWED_ZIP_EXTENSIONS']):
+                tarefa = iniciar_importacao_imagens(file_zip)
+                flash(f'Imagens do ZIP em processamento (tarefa {tarefa.id}). '
+                      f'Acompanhe em {url_for("status_importacao", tarefa_id=tarefa.id)}', 'info')
             elif file_zip.filename != '':
                  flash('Por favor, envie um arquivo ZIP válido para as imagens', 'error')
-                 
+
+        if request.accept_mimetypes.best == 'application/json':
+            resposta = {'csv': relatorio, 'tarefa': None}
+            if tarefa is None:
+                return jsonify(resposta), 200
+            resposta.update(tarefa=tarefa.id, status=url_for('status_importacao', tarefa_id=tarefa.id))
+            return jsonify(resposta), 202
         return redirect(url_for('admin_corridas'))
     
     return render_template('admin/importar_corridas.html')
 
+@app.route('/admin/corrida/importar/<tarefa_id>')
+@login_required
+def status_importacao(tarefa_id):
+    tarefa = db.get_or_404(TarefaImportacao, tarefa_id)
+    return jsonify(tarefa.progresso())
+
 
 @app.route('/admin/corrida/editar/<int:id>', methods=['GET', 'POST'])
 @login_required
@@ -363,6 +1142,7 @@ def editar_corrida(id):
                         corrida.imagem = filename
             
             db.session.commit()
+            feed.invalidar()
             flash('Corrida atualizada com sucesso!', 'success')
             return redirect(url_for('admin_corridas'))
         except Exception as e:
@@ -380,6 +1160,7 @@ def excluir_corrida(id):
         
         db.session.delete(corrida)
         db.session.commit()
+        feed.invalidar()
         flash('Corrida excluída com sucesso!', 'success')
     except Exception as e:
         flash(f'Erro ao excluir corrida: {str(e)}', 'error')
@@ -390,8 +1171,9 @@ def excluir_corrida(id):
 @app.route('/admin/blog')
 @login_required
 def admin_blog():
-    posts = Post.query.order_by(Post.data_publicacao.desc()).all()
-    return render_template('admin/blog.html', posts=posts)
+    posts, proximo = paginar(Post.query, Post, Post.data_publicacao, descendente=True,
+                             cursor=request.args.get('depois'), por_pagina=_limite_pagina())
+    return render_template('admin/blog.html', posts=posts, proximo_cursor=proximo)
 
 @app.route('/admin/blog/novo', methods=['GET', 'POST'])
 @login_required
@@ -466,8 +1248,9 @@ def excluir_post(id):
 @app.route('/admin/promocoes')
 @login_required
 def admin_promocoes():
-    promocoes = Promocao.query.order_by(Promocao.created_at.desc()).all()
-    return render_template('admin/promocoes.html', promocoes=promocoes)
+    promocoes, proximo = paginar(Promocao.query, Promocao, Promocao.created_at, descendente=True,
+                                 cursor=request.args.get('depois'), por_pagina=_limite_pagina())
+    return render_template('admin/promocoes.html', promocoes=promocoes, proximo_cursor=proximo)
 
 @app.route('/admin/promocao/nova', methods=['GET', 'POST'])
 @login_required
@@ -491,6 +1274,7 @@ def nova_promocao():
             
             db.session.add(promocao)
             db.session.commit()
+            feed.invalidar()
             flash('Promoção/Anúncio criado com sucesso!', 'success')
             return redirect(url_for('admin_promocoes'))
         except Exception as e:
@@ -523,6 +1307,7 @@ def editar_promocao(id):
                         promocao.imagem = filename
             
             db.session.commit()
+            feed.invalidar()
             flash('Promoção/Anúncio atualizado com sucesso!', 'success')
             return redirect(url_for('admin_promocoes'))
         except Exception as e:
@@ -540,6 +1325,7 @@ def excluir_promocao(id):
         
         db.session.delete(promocao)
         db.session.commit()
+        feed.invalidar()
         flash('Promoção/Anúncio excluído com sucesso!', 'success')
     except Exception as e:
         flash(f'Erro ao excluir promoção/anúncio: {str(e)}', 'error')
@@ -551,31 +1337,86 @@ def excluir_promocao(id):
 @app.route('/admin/estatisticas')
 @login_required
 def estatisticas():
-    # Estatísticas básicas
-    total_acessos = Acesso.query.count()
-    total_corridas = Corrida.query.count()
-    total_posts = Post.query.count()
-    acessos_hoje = Acesso.query.filter(
-        Acesso.data >= datetime.today().date()
-    ).count()
+    # Estatísticas básicas (tabelas de totais, não os acessos individuais)
+    acessos = resumo_acessos()
     
     # Top páginas
-    from sqlalchemy import func
     top_paginas = db.session.query(
-        Acesso.pagina, 
-        func.count(Acesso.id).label('total')
-    ).group_by(Acesso.pagina).order_by(func.count(Acesso.id).desc()).limit(10).all()
+        AcessoDia.pagina, 
+        func.sum(AcessoDia.total).label('total')
+    ).group_by(AcessoDia.pagina).order_by(func.sum(AcessoDia.total).desc()).limit(10).all()
     
     return render_template('admin/estatisticas.html',
-                         total_acessos=total_acessos,
-                         total_corridas=total_corridas,
-                         total_posts=total_posts,
-                         acessos_hoje=acessos_hoje,
-                         top_paginas=top_paginas)
+                         total_acessos=acessos['total_acessos'],
+                         total_corridas=acessos['total_corridas'],
+                         total_posts=acessos['total_posts'],
+                         acessos_hoje=acessos['acessos_hoje'],
+                         top_paginas=top_paginas,
+                         fila_acessos=fila_acessos.estado())
+
+# Página simples, sem depender dos templates do painel
+PAGINA_PERF = '''<!doctype html>
+<html lang="pt-br">
+<head><meta charset="utf-8"><title>Consultas SQL</title>
+<style>
+body { font-family: sans-serif; margin: 2em; }
+table { border-collapse: collapse; margin-bottom: 2em; }
+th, td { border: 1px solid #ccc; padding: 4px 8px; text-align: right; }
+td.texto, th.texto { text-align: left; }
+code { white-space: pre-wrap; }
+</style></head>
+<body>
+<h1>Consultas por endpoint</h1>
+<table>
+<tr><th class="texto">Endpoint</th><th>Requisições</th><th>Consultas/req.</th>
+<th>Máx. consultas</th><th>ms/req.</th><th>ms total</th></tr>
+{% for item in endpoints %}
+<tr><td class="texto">{{ item.endpoint }}</td><td>{{ item.requisicoes }}</td>
+<td>{{ item.consultas_por_requisicao }}</td><td>{{ item.maximo_consultas }}</td>
+<td>{{ item.ms_por_requisicao }}</td><td>{{ item.ms_total }}</td></tr>
+{% else %}
+<tr><td class="texto" colspan="6">Nenhuma requisição ainda.</td></tr>
+{% endfor %}
+</table>
+<h1>Consultas acima de {{ limite_lenta_ms }} ms</h1>
+<table>
+<tr><th class="texto">Quando (UTC)</th><th class="texto">Endpoint</th><th>ms</th><th class="texto">SQL</th></tr>
+{% for lenta in lentas %}
+<tr><td class="texto">{{ lenta.quando }}</td><td class="texto">{{ lenta.endpoint or '-' }}</td>
+<td>{{ lenta.ms }}</td><td class="texto"><code>{{ lenta.sql }}</code></td></tr>
+{% else %}
+<tr><td class="texto" colspan="4">Nenhuma consulta lenta.</td></tr>
+{% endfor %}
+</table>
+</body>
+</html>'''
+
+@app.route('/admin/perf')
+@login_required
+def perf():
+    # Consultas por endpoint e as mais lentas, desde o início do processo
+    estado = perfil_sql.estado()
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(estado)
+    return render_template_string(PAGINA_PERF, **estado)
+
+def preparar_banco():
+    # Tabelas, índices e os totais de acessos antigos. Roda ao importar o
+    # módulo (gunicorn também), uma vez por worker: tudo é idempotente, e a
+    # trava no arquivo do banco evita que dois workers façam isso juntos.
+    with app.app_context():
+        caminho = db.engine.url.database
+        trava = travado(caminho) if caminho and caminho != ':memory:' else contextlib.nullcontext()
+        with trava:
+            db.create_all()
+            deduplicar_corridas()
+            criar_indices()
+            consolidar_acessos_antigos()
+
+preparar_banco()
 
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
         # Chama a rota de setup para criar o admin na primeira execução se não existir
         if not Usuario.query.first():
             print("Criando usuário admin padrão: admin / admin_password_123. Mude a senha!")
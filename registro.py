@@ -0,0 +1,374 @@
+import bisect
+import csv
+import io
+import threading
+import time
+import unicodedata
+from collections import Counter
+from datetime import datetime
+
+from arquivos import Cauda, anexar, escrita_atomica, sincronizador, travado
+from urna import Urna
+
+TOTAL_DIAS = 16
+COLUNAS = ['id', 'nome', 'idade', 'cep', 'rua', 'bairro', 'casa', 'telefone',
+           'como_soube'] + [f'dia{i}' for i in range(1, TOTAL_DIAS + 1)]
+
+# Resultado de cada item em marcar_presencas
+MARCADA = 'marcada'
+JA_MARCADA = 'ja_marcada'
+NAO_ENCONTRADA = 'nao_encontrada'
+DIA_INVALIDO = 'dia_invalido'
+
+
+def normalizar_nome(nome):
+    # Chave de busca sem acentos e sem diferença entre maiúsculas/minúsculas
+    decomposto = unicodedata.normalize('NFKD', nome.strip())
+    return ''.join(c for c in decomposto if not unicodedata.combining(c)).casefold()
+
+
+class IndiceNomes:
+    # Lista ordenada de (nome normalizado, id). Uma busca por prefixo é só
+    # um par de bisect, O(log n), mais o tamanho da página devolvida.
+
+    def __init__(self, pares=()):
+        self._chaves = sorted((normalizar_nome(nome), pessoa_id)
+                              for nome, pessoa_id in pares)
+
+    def adicionar_varios(self, pares):
+        # Em lote sai mais barato reordenar tudo do que inserir um a um
+        novos = [(normalizar_nome(nome), pessoa_id) for nome, pessoa_id in pares]
+        if len(novos) <= 8:
+            for chave in novos:
+                bisect.insort(self._chaves, chave)
+        else:
+            self._chaves.extend(novos)
+            self._chaves.sort()
+
+    def _intervalo(self, prefixo):
+        prefixo = normalizar_nome(prefixo)
+        inicio = bisect.bisect_left(self._chaves, (prefixo,))
+        fim = bisect.bisect_left(self._chaves, (prefixo + '\uffff',))
+        return inicio, fim
+
+    def buscar(self, prefixo, inicio=0, limite=None):
+        # Retorna (ids da página, total de nomes com o prefixo)
+        primeiro, ultimo = self._intervalo(prefixo)
+        primeiro = min(primeiro + inicio, ultimo)
+        if limite is not None:
+            ultimo = min(primeiro + limite, ultimo)
+        ids = [pessoa_id for _, pessoa_id in self._chaves[primeiro:ultimo]]
+        return ids, self.contar(prefixo)
+
+    def contar(self, prefixo):
+        primeiro, ultimo = self._intervalo(prefixo)
+        return ultimo - primeiro
+
+
+class Registro:
+    # Cadastro de pessoas carregado uma única vez em memória e indexado por
+    # id, nome e dia. O dados.csv continua sendo a fonte da verdade: linhas
+    # acrescentadas por outros workers são lidas na próxima consulta e, se o
+    # arquivo for trocado (compactação, edit_file), o índice é recarregado.
+    #
+    # Os ids vêm de uma sequência em <dados>.seq, protegida pela trava do
+    # dados.csv: cadastrar não percorre o arquivo e dois workers nunca
+    # recebem o mesmo id.
+    #
+    # As presenças não reescrevem o dados.csv: cada marcação vira uma linha
+    # (pessoa_id, dia, horário) no diário, que é consolidado no formato largo
+    # do dados.csv por compactar().
+    #
+    # Toda escrita passa pelas travas de arquivo (arquivos.travado), então
+    # vários workers podem cadastrar e marcar presenças ao mesmo tempo; o
+    # dados.csv só é reescrito de forma atômica.
+    #
+    # Os participantes do sorteio de cada dia ficam em
+    # <pasta_sorteio>/<dd-mm-YYYY>.csv, com linhas (id, nome, status).
+
+    def __init__(self, caminho='dados.csv', diario='presencas.csv',
+                 pasta_sorteio='sorteio'):
+        self.caminho = caminho
+        self.diario = diario
+        self.urna = Urna(pasta_sorteio)
+        self._trava = threading.RLock()
+        self._cauda_dados = Cauda(caminho)
+        self._cauda_diario = Cauda(diario)
+        self._linhas_diario = 0
+        self._versao = 0
+        self._carregar()
+
+    def _carregar(self):
+        self._versao += 1
+        self._pessoas = {}
+        self._por_nome = {}
+        self._presentes = {dia: set() for dia in range(1, TOTAL_DIAS + 1)}
+        self._como_soube = Counter()
+        self._ultimo_id = 0
+        self._pendentes = {}  # id -> dias vistos no diário antes do cadastro
+        self._nomes = IndiceNomes()
+        self._cauda_dados.fechar()
+        self._cauda_diario.fechar()
+        self._linhas_diario = 0
+        self._ler_dados()
+        self._ler_diario()
+
+    def _ler_dados(self):
+        # Indexa as linhas acrescentadas ao dados.csv desde a última leitura
+        cabecalho = self._cauda_dados.posicao == 0
+        linhas = self._cauda_dados.linhas()
+        if cabecalho:
+            linhas = linhas[1:]
+        novos = [self._indexar(linha) for linha in linhas if linha and linha[0]]
+        self._nomes.adicionar_varios(
+            (pessoa['nome'], pessoa['id']) for pessoa in novos)
+
+    def _indexar(self, linha):
+        linha = (linha + [''] * len(COLUNAS))[:len(COLUNAS)]
+        pessoa = dict(zip(COLUNAS, linha))
+        pessoa_id = pessoa['id']
+
+        self._versao += 1
+        self._pessoas[pessoa_id] = pessoa
+        self._por_nome.setdefault(pessoa['nome'], []).append(pessoa_id)
+        self._como_soube[pessoa['como_soube']] += 1
+        for dia in range(1, TOTAL_DIAS + 1):
+            if pessoa[f'dia{dia}'] == '1':
+                self._presentes[dia].add(pessoa_id)
+        for dia in self._pendentes.pop(pessoa_id, ()):
+            pessoa[f'dia{dia}'] = '1'
+            self._presentes[dia].add(pessoa_id)
+        try:
+            self._ultimo_id = max(self._ultimo_id, int(pessoa_id))
+        except ValueError:
+            pass
+        return pessoa
+
+    def _aplicar_presenca(self, pessoa_id, dia):
+        pessoa = self._pessoas.get(str(pessoa_id))
+        if dia not in self._presentes:
+            return False
+        if pessoa is None:
+            # A linha do cadastro pode ainda não ter sido lida deste processo
+            self._pendentes.setdefault(str(pessoa_id), set()).add(dia)
+            return False
+        if pessoa['id'] not in self._presentes[dia]:
+            pessoa[f'dia{dia}'] = '1'
+            self._presentes[dia].add(pessoa['id'])
+            self._versao += 1
+        return True
+
+    def _ler_diario(self):
+        # Aplica as entradas novas do diário. As entradas são idempotentes,
+        # então reler uma linha não tem efeito.
+        for linha in self._cauda_diario.linhas():
+            if len(linha) >= 2 and linha[1].isdigit():
+                self._aplicar_presenca(linha[0], int(linha[1]))
+                self._linhas_diario += 1
+
+    def _sincronizar(self):
+        # Os dois arquivos só são trocados juntos, por compactar() ou por uma
+        # edição manual; nesse caso tudo é recarregado.
+        if self._cauda_dados.trocado() or self._cauda_diario.trocado():
+            self._carregar()
+        else:
+            self._ler_dados()
+            self._ler_diario()
+
+    def _reescrever(self):
+        # Chamado com a trava do dados.csv, com tudo já em memória
+        with escrita_atomica(self.caminho) as arquivo_csv:
+            writer = csv.writer(arquivo_csv)
+            writer.writerow(COLUNAS)
+            for pessoa in self._pessoas.values():
+                writer.writerow([pessoa[coluna] for coluna in COLUNAS])
+        self._cauda_dados.reabrir()
+
+    @property
+    def versao(self):
+        # Muda a cada alteração vista por este processo; serve de chave de cache
+        with self._trava:
+            self._sincronizar()
+            return self._versao
+
+    def assinatura(self):
+        # Identifica a versão dos dados em disco, igual para todos os processos
+        with self._trava:
+            self._sincronizar()
+            mtime, tamanho = self._cauda_dados.estado()
+            return f'{mtime}-{tamanho}-{self._cauda_diario.posicao}'
+
+    def obter(self, pessoa_id):
+        with self._trava:
+            self._sincronizar()
+            return self._pessoas.get(str(pessoa_id))
+
+    def nome(self, pessoa_id):
+        pessoa = self.obter(pessoa_id)
+        return pessoa['nome'] if pessoa else None
+
+    def buscar_por_nome(self, nome):
+        with self._trava:
+            self._sincronizar()
+            return [self._pessoas[i] for i in self._por_nome.get(nome, [])]
+
+    def presentes(self, dia):
+        with self._trava:
+            self._sincronizar()
+            return [self._pessoas[i] for i in self._presentes.get(dia, ())]
+
+    def por_prefixo(self, prefixo, inicio=0, limite=None):
+        # Pessoas cujo nome começa com o prefixo (sem considerar acentos ou
+        # maiúsculas), em ordem alfabética. Retorna (página, total).
+        with self._trava:
+            self._sincronizar()
+            ids, total = self._nomes.buscar(prefixo, inicio, limite)
+            return [self._pessoas[i] for i in ids], total
+
+    def pessoas(self):
+        with self._trava:
+            self._sincronizar()
+            return list(self._pessoas.values())
+
+    def __len__(self):
+        with self._trava:
+            self._sincronizar()
+            return len(self._pessoas)
+
+    def resumo(self):
+        # Agregados mantidos a cada cadastro/presença; não percorre as pessoas
+        with self._trava:
+            self._sincronizar()
+            return {
+                'total': len(self._pessoas),
+                'presentes_por_dia': {dia: len(ids) for dia, ids in self._presentes.items()},
+                'como_soube': dict(self._como_soube),
+            }
+
+    def _alocar(self, quantidade):
+        # Chamado com a trava do dados.csv. A sequência em <dados>.seq nunca
+        # volta atrás, nem se linhas forem apagadas do dados.csv; se o
+        # arquivo se perder, continua do maior id cadastrado.
+        sequencia = self.caminho + '.seq'
+        try:
+            with open(sequencia, 'r') as arquivo:
+                ultimo = int(arquivo.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            ultimo = 0
+        ultimo = max(ultimo, self._ultimo_id)
+        with escrita_atomica(sequencia, sincronizar=False) as arquivo:
+            arquivo.write(f'{ultimo + quantidade}\n')
+        return range(ultimo + 1, ultimo + quantidade + 1)
+
+    def alocar_ids(self, quantidade):
+        # Reserva um intervalo de ids consecutivos, para importações que
+        # precisam saber os ids antes de gravar
+        with self._trava, travado(self.caminho):
+            self._sincronizar()
+            return self._alocar(quantidade)
+
+    def adicionar(self, campos):
+        # campos: todas as colunas do cadastro, exceto o id e os dias
+        return self.adicionar_varios([campos])[0]
+
+    def adicionar_varios(self, cadastros, ids=None):
+        # Cadastra várias pessoas com uma única escrita no dados.csv.
+        # `ids` pode vir de alocar_ids(); senão um intervalo é alocado aqui.
+        # Retorna os ids, na ordem dos cadastros.
+        with self._trava, travado(self.caminho):
+            self._sincronizar()
+            if ids is None:
+                ids = self._alocar(len(cadastros))
+            linhas = []
+            for novo_id, campos in zip(ids, cadastros):
+                # Quebras de linha dentro de um campo impediriam ler o
+                # dados.csv linha a linha
+                linha = [str(novo_id)] + [
+                    '' if campo is None else ' '.join(str(campo).splitlines())
+                    for campo in campos]
+                linha += [''] * (len(COLUNAS) - len(linha))
+                linhas.append(linha)
+
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(linhas)
+            with open(self.caminho, 'a', newline='') as arquivo_csv:
+                arquivo_csv.write(buffer.getvalue())
+            sincronizador.marcar(self.caminho)
+
+            self._ler_dados()
+            return [int(novo_id) for novo_id in ids]
+
+    def marcar_presencas(self, itens):
+        # Marca vários pares (pessoa_id, dia) com uma única escrita no
+        # diário. Repetições, no lote ou já gravadas, não geram nova linha.
+        with self._trava:
+            self._sincronizar()
+            resultados, linhas = [], []
+            horario = datetime.now().isoformat(timespec='seconds')
+            for pessoa_id, dia in itens:
+                pessoa = self._pessoas.get(str(pessoa_id))
+                if pessoa is None:
+                    resultados.append(NAO_ENCONTRADA)
+                elif dia not in self._presentes:
+                    resultados.append(DIA_INVALIDO)
+                elif pessoa['id'] in self._presentes[dia]:
+                    resultados.append(JA_MARCADA)
+                else:
+                    self._aplicar_presenca(pessoa['id'], dia)
+                    linhas.append([pessoa['id'], dia, horario])
+                    resultados.append(MARCADA)
+
+            if linhas:
+                # A posição de leitura não avança aqui: as linhas gravadas são
+                # relidas no próximo _sincronizar() junto com as de outros
+                # processos.
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(linhas)
+                anexar(self.diario, buffer.getvalue())
+            return resultados
+
+    def compactar(self):
+        # Consolida o diário no dados.csv. Com as duas travas ninguém grava
+        # durante a compactação; se o processo cair entre reescrever o
+        # dados.csv e esvaziar o diário, reaplicar o diário não muda nada.
+        with self._trava, travado(self.caminho), travado(self.diario):
+            self._sincronizar()
+            entradas = self._linhas_diario
+            if entradas == 0:
+                return 0
+
+            self._reescrever()
+            # Diário novo no lugar do antigo (e não truncado), para quem
+            # ainda lê o antigo perceber a troca pelo inode
+            with escrita_atomica(self.diario):
+                pass
+            self._cauda_diario.reabrir()
+            self._linhas_diario = 0
+            return entradas
+
+    def exportar_csv(self):
+        # Caminho de um CSV no formato largo, atualizado com o diário
+        self.compactar()
+        return self.caminho
+
+    def compactar_periodicamente(self, intervalo=300):
+        def executar():
+            while True:
+                time.sleep(intervalo)
+                try:
+                    self.compactar()
+                except OSError as erro:
+                    print(f'Erro ao compactar {self.diario}: {erro}')
+
+        thread = threading.Thread(target=executar, daemon=True)
+        thread.start()
+        return thread
+
+    def elegiveis_sorteio(self, data):
+        return self.urna.elegiveis(data)
+
+    def inscrever_sorteio_varios(self, data, pessoas):
+        return self.urna.inscrever_varios(data, pessoas)
+
+    def sortear(self, data, quantidade):
+        return self.urna.sortear(data, quantidade)
@@ -0,0 +1,91 @@
+import csv
+import json
+import os
+
+import pytest
+
+from eventos import Canal
+from exportacao import ExportacaoExcel
+from registro import COLUNAS, JA_MARCADA, MARCADA, Registro
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # O app.py abre dados.csv, presencas.csv e sorteio/ no diretório atual
+    # ao ser importado; o registro, o canal e a exportação são trocados
+    # pelos do tmp_path e hoje é o 3º dia da campanha
+    monkeypatch.chdir(tmp_path)
+    import app
+
+    dados = tmp_path / 'dados.csv'
+    with open(dados, 'w', newline='') as arquivo:
+        csv.writer(arquivo).writerow(COLUNAS)
+    registro = Registro(str(dados), str(tmp_path / 'presencas.csv'), str(tmp_path / 'sorteio'))
+    hoje = app.next_14_days[2]
+    monkeypatch.setattr(app, 'registro', registro)
+    monkeypatch.setattr(app, 'now', lambda: hoje)
+    monkeypatch.setattr(app, 'canal', Canal(lambda: hoje, str(tmp_path / 'eventos')))
+    monkeypatch.setattr(app, 'exportacao', ExportacaoExcel(
+        registro, app.next_14_days, str(tmp_path / 'cache'), atraso=3600))
+    return app
+
+
+def cadastro(nome):
+    return [nome, '20', '69000000', 'Rua A', 'Centro', '1', '92999999999', 'convite']
+
+
+def eventos_publicados(app):
+    caminho = app.canal._arquivo(app.now())
+    if not os.path.exists(caminho):
+        return []
+    with open(caminho, encoding='utf-8') as arquivo:
+        return [json.loads(linha) for linha in arquivo]
+
+
+def test_marcar_presencas_em_lote(app):
+    ana = app.registro.adicionar(cadastro('Ana'))
+    bia = app.registro.adicionar(cadastro('Bia'))
+    app.registro.marcar_presencas([(bia, 3)])
+
+    resposta = app.app.test_client().post('/marcar_presencas', json={'presencas': [
+        {'pessoa_id': ana, 'dia': 3},
+        {'pessoa_id': ana, 'dia': 2},
+        {'pessoa_id': bia, 'dia': 3},
+        {'pessoa_id': 'x', 'dia': 3},
+        {'dia': 3},
+    ]})
+
+    assert resposta.status_code == 200
+    resultados = resposta.get_json()['resultados']
+    assert [item['status'] for item in resultados] == [
+        MARCADA, MARCADA, JA_MARCADA, 'invalida', 'invalida']
+    assert [item['success'] for item in resultados] == [True, True, True, False, False]
+    assert app.registro.obter(ana)['dia2'] == app.registro.obter(ana)['dia3'] == '1'
+
+    # Só as presenças de hoje (dia 3) inscrevem no sorteio, uma vez cada
+    inscritos = app.registro.elegiveis_sorteio(app.now())
+    assert sorted(pessoa['nome'] for pessoa in inscritos) == ['Ana', 'Bia']
+    assert [(evento['dados']['dia'], evento['dados']['nova'], evento['dados']['inscrito'])
+            for evento in eventos_publicados(app)] == [(3, True, True), (2, True, False),
+                                                       (3, False, True)]
+
+
+def test_reenviar_o_lote_nao_tem_efeito(app):
+    ana = app.registro.adicionar(cadastro('Ana'))
+    lote = {'presencas': [{'pessoa_id': ana, 'dia': 3}]}
+    cliente = app.app.test_client()
+
+    cliente.post('/marcar_presencas', json=lote)
+    resposta = cliente.post('/marcar_presencas', json=lote)
+
+    assert resposta.get_json()['resultados'][0]['status'] == JA_MARCADA
+    assert len(app.registro.elegiveis_sorteio(app.now())) == 1
+    assert len(eventos_publicados(app)) == 1
+
+
+def test_lote_invalido(app):
+    cliente = app.app.test_client()
+    for corpo in ({'presencas': 'x'}, {'presencas': [{}] * 1001}, 'x'):
+        resposta = cliente.post('/marcar_presencas', json=corpo)
+        assert resposta.status_code == 400
+        assert resposta.get_json()['success'] is False
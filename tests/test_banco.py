@@ -0,0 +1,126 @@
+import csv
+import sqlite3
+import threading
+
+import pytest
+
+from analise import analise_atual
+from banco import RegistroSQLite
+from registro import (COLUNAS, DIA_INVALIDO, JA_MARCADA, MARCADA, NAO_ENCONTRADA,
+                      TOTAL_DIAS, Registro)
+
+
+def cadastro(nome):
+    return [nome, '20', '69000000', 'Rua A', 'Centro', '1', '92999999999', 'convite']
+
+
+@pytest.fixture(params=['csv', 'sqlite'])
+def registro(request, tmp_path):
+    # Os testes rodam nos dois armazenamentos: o app usa qualquer um
+    if request.param == 'sqlite':
+        return RegistroSQLite(str(tmp_path / 'missao.db'))
+    dados = tmp_path / 'dados.csv'
+    with open(dados, 'w', newline='') as arquivo:
+        csv.writer(arquivo).writerow(COLUNAS)
+    return Registro(str(dados), str(tmp_path / 'presencas.csv'), str(tmp_path / 'sorteio'))
+
+
+def em_outra_thread(funcao):
+    resultado = []
+    thread = threading.Thread(target=lambda: resultado.append(funcao()))
+    thread.start()
+    thread.join()
+    return resultado[0]
+
+
+def test_versao_muda_para_outras_threads(registro):
+    # Cada thread (ou greenlet) do SQLite tem a sua conexão
+    pessoa_id = registro.adicionar(cadastro('Ana'))
+    antes = em_outra_thread(lambda: registro.versao)
+    registro.marcar_presencas([(pessoa_id, 1)])
+    assert em_outra_thread(lambda: registro.versao) != antes
+    assert registro.versao == em_outra_thread(lambda: registro.versao)
+
+
+def test_analise_atual_em_thread_nova_ve_as_presencas(registro):
+    ids = registro.adicionar_varios([cadastro(nome) for nome in ('Ana', 'Bia', 'Caio')])
+    em_outra_thread(lambda: analise_atual(registro, 0))
+    registro.marcar_presencas([(pessoa_id, 2) for pessoa_id in ids])
+    analise = em_outra_thread(lambda: analise_atual(registro, 0))
+    assert analise.totais_por_dia()[1] == 3
+
+
+def test_marcar_presencas_em_lote(registro):
+    ana, bia = registro.adicionar_varios([cadastro('Ana'), cadastro('Bia')])
+    resultados = registro.marcar_presencas(
+        [(ana, 1), (bia, 1), (ana, 1), (999, 1), (bia, 0), (bia, TOTAL_DIAS + 1), ('x', 1)])
+    assert resultados == [MARCADA, MARCADA, JA_MARCADA, NAO_ENCONTRADA,
+                          DIA_INVALIDO, DIA_INVALIDO, NAO_ENCONTRADA]
+    assert registro.obter(ana)['dia1'] == '1'
+    assert registro.obter(ana)['dia2'] == ''
+    assert registro.resumo()['presentes_por_dia'][1] == 2
+    assert registro.marcar_presencas([(str(ana), 2)]) == [MARCADA]
+
+
+def test_cadastro_em_lote_e_busca(registro):
+    ids = registro.adicionar_varios([cadastro('Ana Maria'), cadastro('Álvaro'), cadastro('Bia')])
+    assert len(set(ids)) == 3
+    assert registro.adicionar_varios([cadastro('Caio')], ids=[50]) == [50]
+    assert registro.adicionar(cadastro('Davi')) > 50
+    assert len(registro) == 5
+    pagina, total = registro.por_prefixo('a')
+    assert total == 2
+    assert [pessoa['nome'] for pessoa in pagina] == ['Álvaro', 'Ana Maria']
+    resumo = registro.resumo()
+    assert resumo['total'] == 5
+    assert resumo['como_soube']['convite'] == 5
+
+
+def test_inscricao_no_sorteio_nao_repete(registro):
+    data = '08-07-2025'
+    assert registro.inscrever_sorteio_varios(data, [(1, 'Ana'), (2, 'Bia')]) == [True, True]
+    assert registro.inscrever_sorteio_varios(data, [(2, 'Bia'), (3, 'Caio')]) == [False, True]
+    assert [p['id'] for p in registro.elegiveis_sorteio(data)] == ['1', '2', '3']
+
+    ganhadores = registro.sortear(data, 2)
+    assert len(ganhadores) == 2
+    restantes = registro.elegiveis_sorteio(data)
+    assert len(restantes) == 1
+    assert restantes[0]['id'] not in {ganhador['id'] for ganhador in ganhadores}
+    assert registro.sortear(data, 2) is None
+    with pytest.raises(ValueError):
+        registro.sortear(data, 0)
+
+
+def test_exportar_csv(registro):
+    ana = registro.adicionar(cadastro('Ana'))
+    registro.marcar_presencas([(ana, 3)])
+    with open(registro.exportar_csv(), newline='') as arquivo:
+        linhas = list(csv.DictReader(arquivo))
+    assert [linha['nome'] for linha in linhas] == ['Ana']
+    assert linhas[0]['dia3'] == '1'
+    assert list(linhas[0]) == COLUNAS
+
+
+def test_fechar_conexao(tmp_path):
+    registro = RegistroSQLite(str(tmp_path / 'missao.db'))
+    ana = registro.adicionar(cadastro('Ana'))
+    conexao = registro._conexao()
+    registro.fechar()
+    registro.fechar()
+    with pytest.raises(sqlite3.ProgrammingError):
+        conexao.execute('SELECT 1')
+    assert registro.obter(ana)['nome'] == 'Ana'
+
+
+def test_busca_por_id_nome_e_dia(registro):
+    ana, bia, outra_ana = registro.adicionar_varios(
+        [cadastro('Ana'), cadastro('Bia'), cadastro('Ana')])
+    registro.marcar_presencas([(ana, 4), (bia, 4), (bia, 5)])
+    assert registro.nome(bia) == 'Bia'
+    assert registro.nome(999) is None
+    assert sorted(int(p['id']) for p in registro.buscar_por_nome('Ana')) == [ana, outra_ana]
+    assert registro.buscar_por_nome('Caio') == []
+    assert sorted(int(p['id']) for p in registro.presentes(4)) == [ana, bia]
+    assert [int(p['id']) for p in registro.presentes(5)] == [bia]
+    assert registro.presentes(6) == []
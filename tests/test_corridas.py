@@ -0,0 +1,66 @@
+import io
+import os
+import tempfile
+
+import pytest
+
+# O n.py prepara o banco ao ser importado: usa um banco temporário, e não o
+# instance/corridas.db
+os.environ.setdefault('CORRIDAS_BANCO', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'corridas.db'))
+import n
+
+CABECALHO = 'nome,data,local,valor,distancia,imagem,descricao,promovida\n'
+
+
+@pytest.fixture
+def contexto(tmp_path, monkeypatch):
+    # importar_csv_corridas troca o feed.versao do diretório atual
+    monkeypatch.chdir(tmp_path)
+    with n.app.app_context():
+        n.Corrida.query.delete()
+        n.db.session.commit()
+        yield
+
+
+def importar(*linhas):
+    return n.importar_csv_corridas(io.BytesIO((CABECALHO + ''.join(linhas)).encode()))
+
+
+def corridas():
+    return {(corrida.nome, corrida.data.strftime('%Y-%m-%d %H:%M')): corrida
+            for corrida in n.Corrida.query}
+
+
+def test_reimportar_atualiza_sem_duplicar(contexto):
+    resultado = importar('Corrida A,2025-08-10 07:00,Ponta Negra,50,5,a.jpg,,false\n',
+                         'Corrida B,2025-08-17 07:00,Centro,"60,5",10,,,true\n')
+    assert (resultado['inseridas'], resultado['atualizadas']) == (2, 0)
+
+    # Sem imagem no CSV a imagem que já existe fica; o resto é atualizado
+    resultado = importar('Corrida A,2025-08-10 07:00,Bola da Suframa,55,5,,nova,true\n',
+                         'Corrida A,2025-08-11 07:00,Centro,50,5,,,\n')
+    assert (resultado['inseridas'], resultado['atualizadas']) == (1, 1)
+
+    todas = corridas()
+    assert len(todas) == 3
+    a = todas[('Corrida A', '2025-08-10 07:00')]
+    assert (a.local, a.valor, a.imagem, a.descricao, a.promovida) == (
+        'Bola da Suframa', 55.0, 'a.jpg', 'nova', True)
+    assert todas[('Corrida B', '2025-08-17 07:00')].valor == 60.5
+
+
+def test_repetida_no_mesmo_lote_vale_a_ultima(contexto):
+    resultado = importar('Corrida A,2025-08-10 07:00,Centro,50,5,a.jpg,,\n',
+                         'Corrida A,10/08/2025 07:00,Centro,70,5,,,\n')
+    assert (resultado['inseridas'], resultado['atualizadas']) == (1, 1)
+    assert [(corrida.valor, corrida.imagem) for corrida in corridas().values()] == [(70.0, 'a.jpg')]
+
+
+def test_linhas_invalidas_nao_interrompem(contexto):
+    resultado = importar('Corrida A,2025-08-10 07:00,Centro,50,5,,,\n',
+                         'Corrida B,amanhã,Centro,50,5,,,\n',
+                         ',2025-08-10 07:00,Centro,50,5,,,\n',
+                         'Corrida C,2025-08-10 07:00,Centro,caro,5,,,\n')
+    assert (resultado['inseridas'], resultado['invalidas']) == (1, 3)
+    assert [erro['linha'] for erro in resultado['erros']] == [3, 4, 5]
+    assert list(corridas()) == [('Corrida A', '2025-08-10 07:00')]
@@ -0,0 +1,50 @@
+import os
+import time
+
+from eventos import Canal
+
+
+def canal(tmp_path, **opcoes):
+    return Canal(lambda: '08-07-2025', str(tmp_path / 'eventos'), intervalo=0.01, **opcoes)
+
+
+def ultimo_id(mensagens):
+    return [linha[4:] for linha in ''.join(mensagens).splitlines() if linha.startswith('id: ')][-1]
+
+
+def test_consulta_entrega_so_o_que_veio_depois(tmp_path):
+    # Sem gevent cada requisição a /eventos responde na hora e termina
+    eventos = canal(tmp_path)
+    primeira = list(eventos.escutar(None))
+    assert 'event:' not in ''.join(primeira)
+
+    eventos.publicar_varios([('presenca', {'id': '1'}), ('presenca', {'id': '2'})])
+    segunda = list(eventos.escutar(ultimo_id(primeira)))
+    assert ''.join(segunda).count('event: presenca') == 2
+    assert 'event:' not in ''.join(eventos.escutar(ultimo_id(segunda)))
+
+
+def test_arquivos_antigos_sao_apagados_no_dia_novo(tmp_path):
+    eventos = canal(tmp_path)
+    os.makedirs(eventos.pasta)
+    antigo = os.path.join(eventos.pasta, '01-07-2025.jsonl')
+    recente = os.path.join(eventos.pasta, '07-07-2025.jsonl')
+    for caminho, idade in ((antigo, 3 * 86400), (recente, 3600)):
+        with open(caminho, 'w') as arquivo:
+            arquivo.write('{"tipo": "presenca", "dados": {}}\n')
+        momento = time.time() - idade
+        os.utime(caminho, (momento, momento))
+    eventos.publicar('presenca', {'id': '1'})
+    assert sorted(os.listdir(eventos.pasta)) == ['07-07-2025.jsonl', '08-07-2025.jsonl']
+
+
+def test_tela_recarrega_quando_perde_eventos(tmp_path):
+    # Mais eventos de uma vez do que o canal guarda: a conexão aberta manda
+    # recarregar em vez de pular os que saíram
+    eventos = canal(tmp_path, maximo=5)
+    transmissao = eventos._transmitir(None, duracao=5, pulso=0.05, retry=3000)
+    assert next(transmissao).startswith('retry:')
+    next(transmissao)  # id da posição atual
+    eventos.publicar_varios([('presenca', {'id': str(i)}) for i in range(20)])
+    restantes = list(transmissao)
+    assert [m for m in restantes if m.startswith('event:')] == ['event: recarregar\ndata: {}\n\n']
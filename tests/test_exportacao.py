@@ -0,0 +1,54 @@
+import os
+import time
+
+from exportacao import ExportacaoExcel
+
+
+class RegistroFalso:
+    def __init__(self):
+        self.assinatura_atual = '1'
+        self.geradas = 0
+
+    def assinatura(self):
+        return self.assinatura_atual
+
+
+def exportacao_falsa(tmp_path, registro, **opcoes):
+    exportacao = ExportacaoExcel(registro, [], str(tmp_path), **opcoes)
+
+    def gerar(destino):
+        registro.geradas += 1
+        with open(destino, 'w') as arquivo:
+            arquivo.write(registro.assinatura_atual)
+    exportacao._gerar = gerar
+    return exportacao
+
+
+def test_versao_anterior_continua_no_disco(tmp_path):
+    # Quem recebeu o caminho antigo ainda consegue abrir o arquivo
+    registro = RegistroFalso()
+    exportacao = exportacao_falsa(tmp_path, registro)
+    antigo = exportacao.caminho()
+    registro.assinatura_atual = '2'
+    novo = exportacao.caminho()
+    assert novo != antigo
+    assert os.path.isfile(antigo)
+
+    velho = time.time() - 3600
+    os.utime(antigo, (velho, velho))
+    registro.assinatura_atual = '3'
+    exportacao.caminho()
+    assert not os.path.exists(antigo)
+    assert os.path.isfile(novo)
+
+
+def test_agendar_gera_no_maximo_uma_vez_por_intervalo(tmp_path):
+    # Alterações contínuas não podem adiar a geração para sempre
+    registro = RegistroFalso()
+    exportacao = exportacao_falsa(tmp_path, registro, atraso=0.2)
+    fim = time.monotonic() + 0.7
+    while time.monotonic() < fim:
+        registro.assinatura_atual = str(time.monotonic())
+        exportacao.agendar()
+        time.sleep(0.02)
+    assert 2 <= registro.geradas <= 4
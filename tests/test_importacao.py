@@ -0,0 +1,86 @@
+import csv
+
+import pytest
+
+from importacao import (LinhaInvalida, importar, normalizar_cep, normalizar_como_soube,
+                        normalizar_idade, normalizar_telefone)
+from registro import COLUNAS, Registro
+
+CABECALHO = ['Nome', 'Idade', 'CEP', 'Endereço', 'Bairro', 'Nº', 'WhatsApp', 'Como soube']
+
+
+@pytest.fixture
+def registro(tmp_path):
+    dados = tmp_path / 'dados.csv'
+    with open(dados, 'w', newline='') as arquivo:
+        csv.writer(arquivo).writerow(COLUNAS)
+    return Registro(str(dados), str(tmp_path / 'presencas.csv'), str(tmp_path / 'sorteio'))
+
+
+def resultado(registro, linhas, simular=False):
+    return list(importar(registro, [CABECALHO] + linhas, simular))[-1]
+
+
+def test_cadastrado_pelo_formulario_nao_e_importado_de_novo(registro):
+    # O formulário grava o telefone como digitado, sem DDD
+    registro.adicionar(['Ana Souza', '20', '69000-000', 'Rua A', 'Centro', '1',
+                        '98888-7777', 'convite'])
+    final = resultado(registro, [
+        ['ana souza', '20', '69000000', 'Rua A', 'Centro', '1', '(92) 98888-7777', ''],
+    ])
+    assert final['duplicadas'] == 1
+    assert final['importadas'] == 0
+    assert len(registro) == 1
+
+
+def test_normalizar_telefone():
+    assert normalizar_telefone('(92) 98888-7777') == '92988887777'
+    assert normalizar_telefone('+55 92 98888-7777') == '92988887777'
+    assert normalizar_telefone(92988887777.0) == '92988887777'
+    assert normalizar_telefone('98888-7777') == '92988887777'
+    assert normalizar_telefone('3232-1010', ddd_padrao='97') == '9732321010'
+    for invalido in ('', '123', '92 98888-77770000'):
+        with pytest.raises(LinhaInvalida):
+            normalizar_telefone(invalido)
+
+
+def test_normalizar_cep_idade_como_soube():
+    assert normalizar_cep('69.000-000') == '69000000'
+    assert normalizar_cep(1234567.0) == '01234567'
+    assert normalizar_cep('') == ''
+    with pytest.raises(LinhaInvalida):
+        normalizar_cep('690')
+
+    assert normalizar_idade(20.0) == '20'
+    assert normalizar_idade('') == ''
+    for invalida in ('vinte', '200'):
+        with pytest.raises(LinhaInvalida):
+            normalizar_idade(invalida)
+
+    assert normalizar_como_soube('Convite') == 'convite'
+    assert normalizar_como_soube('  BANNER ') == 'banner'
+    assert normalizar_como_soube('Instagram') == 'outro'
+    assert normalizar_como_soube('', padrao='propaganda') == 'propaganda'
+
+
+def test_repetidos_na_planilha_e_linhas_invalidas(registro):
+    final = resultado(registro, [
+        ['Ana Souza', '20', '69000000', 'Rua A', 'Centro', '1', '92988887777', 'convite'],
+        ['ANA  SOUZA', '', '', '', '', '', '+55 (92) 98888-7777', ''],
+        ['Ana Souza', '', '', '', '', '', '92977776666', ''],
+        ['', '30', '', '', '', '', '92988887777', ''],
+        ['Bia', 'trinta', '', '', '', '', '92988887777', ''],
+        ['', '', '', '', '', '', '', ''],
+    ])
+    assert (final['lidas'], final['validas'], final['duplicadas'], final['invalidas']) == (5, 2, 1, 2)
+    assert [erro['linha'] for erro in final['erros']] == [5, 6]
+    assert [cadastro[6] for cadastro in final['cadastros']] == ['92988887777', '92977776666']
+    assert final['importadas'] == 2 and len(registro) == 2
+
+
+def test_simulacao_nao_grava(registro):
+    final = resultado(registro, [
+        ['Ana Souza', '20', '69000000', 'Rua A', 'Centro', '1', '92988887777', ''],
+    ], simular=True)
+    assert final['validas'] == 1 and final['importadas'] == 0
+    assert len(registro) == 0
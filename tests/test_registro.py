@@ -0,0 +1,133 @@
+import csv
+import threading
+
+import pytest
+
+from arquivos import anexar, escrita_atomica, travado
+from registro import COLUNAS, JA_MARCADA, MARCADA, TOTAL_DIAS, Registro
+
+
+def cadastro(nome):
+    return [nome, '20', '69000000', 'Rua A', 'Centro', '1', '92999999999', 'convite']
+
+
+@pytest.fixture
+def caminhos(tmp_path):
+    dados = tmp_path / 'dados.csv'
+    with open(dados, 'w', newline='') as arquivo:
+        csv.writer(arquivo).writerow(COLUNAS)
+    return str(dados), str(tmp_path / 'presencas.csv'), str(tmp_path / 'sorteio')
+
+
+def ler_dados(caminho):
+    with open(caminho, newline='') as arquivo:
+        return {linha['id']: linha for linha in csv.DictReader(arquivo)}
+
+
+def test_duas_instancias_no_mesmo_arquivo(caminhos):
+    # Dois workers: cada um vê os cadastros do outro e os ids não se repetem
+    a, b = Registro(*caminhos), Registro(*caminhos)
+    id_a = a.adicionar(cadastro('Ana'))
+    id_b = b.adicionar(cadastro('Bia'))
+    assert id_a != id_b
+    assert b.obter(id_a)['nome'] == 'Ana'
+    assert a.obter(id_b)['nome'] == 'Bia'
+    assert [p['nome'] for p in a.por_prefixo('b')[0]] == ['Bia']
+
+
+def test_presenca_de_outra_instancia_sobrevive_a_compactacao(caminhos):
+    a, b = Registro(*caminhos), Registro(*caminhos)
+    pessoa_id = a.adicionar(cadastro('Ana'))
+    assert b.marcar_presencas([(pessoa_id, 3)]) == [MARCADA]
+
+    assert a.obter(pessoa_id)['dia3'] == '1'
+    assert a.compactar() == 1
+    assert ler_dados(caminhos[0])[str(pessoa_id)]['dia3'] == '1'
+    with open(caminhos[1]) as diario:
+        assert diario.read() == ''
+
+    # b ainda lia o diário antigo: percebe a troca e continua consistente
+    assert b.marcar_presencas([(pessoa_id, 3), (pessoa_id, 4)]) == [JA_MARCADA, MARCADA]
+    relido = Registro(*caminhos)
+    assert relido.obter(pessoa_id)['dia3'] == '1'
+    assert relido.obter(pessoa_id)['dia4'] == '1'
+    assert relido.resumo()['presentes_por_dia'][4] == 1
+
+
+def test_entrada_do_diario_antes_do_cadastro(caminhos):
+    # O diário pode ser lido antes da linha do cadastro chegar ao dados.csv
+    registro = Registro(*caminhos)
+    anexar(caminhos[1], '5,3,2025-07-08T19:00:00\n')
+    assert registro.obter(5) is None
+    assert registro.resumo()['presentes_por_dia'][3] == 0
+
+    Registro(*caminhos).adicionar_varios([cadastro('Caio')], ids=[5])
+    assert registro.obter(5)['dia3'] == '1'
+    assert registro.resumo()['presentes_por_dia'][3] == 1
+    assert registro.compactar() == 1
+    assert ler_dados(caminhos[0])['5']['dia3'] == '1'
+
+
+def test_arquivo_trocado_e_recarregado(caminhos):
+    # Uma edição manual (edit_file) troca o dados.csv inteiro
+    registro = Registro(*caminhos)
+    pessoa_id = registro.adicionar(cadastro('Ana'))
+    with open(caminhos[0], newline='') as arquivo:
+        texto = arquivo.read()
+    with travado(caminhos[0]), escrita_atomica(caminhos[0], newline=None) as arquivo:
+        arquivo.write(texto.replace('Ana', 'Eva'))
+    assert registro.obter(pessoa_id)['nome'] == 'Eva'
+    assert registro.por_prefixo('ana')[1] == 0
+
+
+def test_compactacao_concorrente_com_cadastros_e_presencas(caminhos):
+    base = Registro(*caminhos)
+    ids = base.adicionar_varios([cadastro(f'Pessoa {i}') for i in range(200)])
+    marcador, compactador, cadastrador = (Registro(*caminhos) for _ in range(3))
+    terminou = threading.Event()
+    novos = []
+
+    def marcar():
+        for indice, pessoa_id in enumerate(ids):
+            assert marcador.marcar_presencas([(pessoa_id, indice % TOTAL_DIAS + 1)]) == [MARCADA]
+
+    def cadastrar():
+        for i in range(50):
+            novos.append(cadastrador.adicionar(cadastro(f'Nova {i}')))
+
+    def compactar():
+        while not terminou.is_set():
+            compactador.compactar()
+
+    threads = [threading.Thread(target=alvo) for alvo in (marcar, cadastrar)]
+    thread_compactar = threading.Thread(target=compactar)
+    thread_compactar.start()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    terminou.set()
+    thread_compactar.join()
+
+    for registro in (Registro(*caminhos), base):
+        assert len(registro) == 250
+        assert sum(registro.resumo()['presentes_por_dia'].values()) == 200
+    assert len(set(ids) | set(novos)) == 250
+
+    compactador.compactar()
+    dados = ler_dados(caminhos[0])
+    assert len(dados) == 250
+    for indice, pessoa_id in enumerate(ids):
+        assert dados[str(pessoa_id)][f'dia{indice % TOTAL_DIAS + 1}'] == '1'
+
+
+def test_sorteio_relido_quando_o_arquivo_e_trocado(caminhos):
+    registro = Registro(*caminhos)
+    registro.inscrever_sorteio_varios('08-07-2025', [(1, 'Ana'), (2, 'Bia')])
+    arquivo_dia = f'{caminhos[2]}/08-07-2025.csv'
+    with open(arquivo_dia, newline='') as arquivo:
+        texto = arquivo.read()
+    # Mesmo tamanho: só a troca do inode mostra que mudou
+    with travado(arquivo_dia), escrita_atomica(arquivo_dia, newline=None) as arquivo:
+        arquivo.write(texto.replace('Ana', 'Ivo'))
+    assert [p['nome'] for p in registro.elegiveis_sorteio('08-07-2025')] == ['Ivo', 'Bia']
@@ -0,0 +1,51 @@
+import pytest
+
+from urna import Urna
+
+DATA = '08-07-2025'
+
+
+def inscrever(urna, quantidade):
+    urna.inscrever_varios(DATA, [(pessoa_id, f'Pessoa {pessoa_id}')
+                                 for pessoa_id in range(1, quantidade + 1)])
+
+
+def test_sorteio_sem_repeticao(tmp_path):
+    urna = Urna(str(tmp_path))
+    inscrever(urna, 10)
+
+    ganhadores = []
+    while True:
+        sorteados = urna.sortear(DATA, 3)
+        if sorteados is None:
+            break
+        ganhadores += [sorteado['id'] for sorteado in sorteados]
+
+    assert len(ganhadores) == len(set(ganhadores)) == 9
+    restante = [pessoa['id'] for pessoa in urna.elegiveis(DATA)]
+    assert len(restante) == 1 and restante[0] not in ganhadores
+    assert [sorteado['id'] for sorteado in urna.sortear(DATA, 1)] == restante
+    assert urna.sortear(DATA, 1) is None
+
+
+def test_sorteio_sem_repeticao_entre_workers(tmp_path):
+    # Duas urnas na mesma pasta: uma nunca sorteia quem a outra já sorteou,
+    # nem depois de reler o arquivo do dia
+    a, b = Urna(str(tmp_path)), Urna(str(tmp_path))
+    inscrever(a, 6)
+
+    ganhadores = [sorteado['id'] for urna in (a, b, a) for sorteado in urna.sortear(DATA, 2)]
+    assert len(set(ganhadores)) == 6
+    assert Urna(str(tmp_path)).elegiveis(DATA) == []
+
+    # Reinscrever um ganhador não o devolve ao sorteio
+    assert b.inscrever_varios(DATA, [(ganhadores[0], 'Pessoa')]) == [False]
+    assert b.sortear(DATA, 1) is None
+
+
+def test_quantidade_invalida(tmp_path):
+    urna = Urna(str(tmp_path))
+    inscrever(urna, 2)
+    with pytest.raises(ValueError):
+        urna.sortear(DATA, 0)
+    assert len(urna.elegiveis(DATA)) == 2
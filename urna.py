@@ -0,0 +1,141 @@
+import contextlib
+import csv
+import io
+import os
+import random
+import threading
+from collections import OrderedDict
+
+from arquivos import Cauda, sincronizador, travado
+
+
+class _Dia:
+    def __init__(self, caminho):
+        self.participantes = {}  # id -> [nome, status], na ordem de inscrição
+        self.elegiveis = []      # ids com status '0'
+        self.posicao = {}        # id -> índice em elegiveis
+        self.cauda = Cauda(caminho)  # linhas do arquivo ainda não aplicadas
+
+    def aplicar(self, pessoa_id, nome, status):
+        self.participantes[pessoa_id] = [nome, status]
+        if status == '0' and pessoa_id not in self.posicao:
+            self.posicao[pessoa_id] = len(self.elegiveis)
+            self.elegiveis.append(pessoa_id)
+        elif status != '0' and pessoa_id in self.posicao:
+            self.remover(pessoa_id)
+
+    def remover(self, pessoa_id):
+        # Troca com o último elegível e remove do fim: O(1)
+        indice = self.posicao.pop(pessoa_id)
+        ultimo = self.elegiveis.pop()
+        if ultimo != pessoa_id:
+            self.elegiveis[indice] = ultimo
+            self.posicao[ultimo] = indice
+
+
+class Urna:
+    # Participantes do sorteio de cada dia, indexados por id, com a lista de
+    # elegíveis (status '0') pronta para o sorteio.
+    #
+    # O arquivo <pasta>/<dd-mm-YYYY>.csv só recebe linhas novas (id, nome,
+    # status): inscrever acrescenta a linha com status '0' e sortear
+    # acrescenta as linhas dos ganhadores com status '1'. Ao ler, vale a
+    # última linha de cada id.
+    #
+    # Inscrições e sorteios seguram a trava do arquivo do dia
+    # (arquivos.travado, a mesma do edit_file), então workers diferentes
+    # nunca inscrevem a mesma pessoa duas vezes nem sorteiam alguém que
+    # outro worker acabou de sortear. Se o arquivo for trocado (edit_file),
+    # a troca é percebida pelo inode e o dia é relido. Só os
+    # `dias_em_memoria` dias usados mais recentemente ficam em memória.
+
+    def __init__(self, pasta='sorteio', dias_em_memoria=3):
+        self.pasta = pasta
+        self.dias_em_memoria = dias_em_memoria
+        self._trava = threading.RLock()
+        self._dias = OrderedDict()
+
+    def _arquivo(self, data):
+        return os.path.join(self.pasta, f'{data}.csv')
+
+    def _dia(self, data):
+        # Estado do dia, atualizado com o que outros processos gravaram
+        dia = self._dias.get(data)
+        if dia is None or dia.cauda.trocado():
+            if dia is not None:
+                dia.cauda.fechar()
+            dia = self._dias[data] = _Dia(self._arquivo(data))
+        self._dias.move_to_end(data)
+        while len(self._dias) > self.dias_em_memoria:
+            self._dias.popitem(last=False)[1].cauda.fechar()
+        for linha in dia.cauda.linhas():
+            if len(linha) >= 3:
+                dia.aplicar(linha[0], linha[1], linha[2])
+        return dia
+
+    @contextlib.contextmanager
+    def _travado(self, data):
+        # Trava exclusiva do arquivo do dia, entre threads e processos. O
+        # estado é relido já com a trava para incluir o que outros gravaram.
+        with self._trava:
+            os.makedirs(self.pasta, exist_ok=True)
+            with travado(self._arquivo(data)), \
+                    open(self._arquivo(data), 'a', newline='') as arquivo:
+                yield self._dia(data), arquivo
+
+    def _anexar(self, arquivo, linhas, sincronizar=False):
+        # Uma única escrita em modo append, para as linhas irem juntas.
+        # Resultados de sorteio vão para o disco na hora; inscrições entram
+        # no fsync agrupado.
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(linhas)
+        arquivo.write(buffer.getvalue())
+        arquivo.flush()
+        if sincronizar:
+            os.fsync(arquivo.fileno())
+        else:
+            sincronizador.marcar(arquivo.name)
+
+    def elegiveis(self, data):
+        with self._trava:
+            dia = self._dia(data)
+            return [{'id': pessoa_id, 'nome': nome}
+                    for pessoa_id, (nome, status) in dia.participantes.items()
+                    if status == '0']
+
+    def inscrever_varios(self, data, pessoas):
+        # Inscreve vários (pessoa_id, nome) com uma única escrita. Retorna,
+        # para cada um, se a inscrição é nova.
+        with self._travado(data) as (dia, arquivo):
+            novas, linhas = [], []
+            for pessoa_id, nome in pessoas:
+                nova = str(pessoa_id) not in dia.participantes
+                if nova:
+                    dia.aplicar(str(pessoa_id), nome, '0')
+                    linhas.append([pessoa_id, nome, '0'])
+                novas.append(nova)
+            if linhas:
+                self._anexar(arquivo, linhas)
+            return novas
+
+    def sortear(self, data, quantidade):
+        # Sorteia sem reposição em O(quantidade). Retorna a lista de
+        # {'id', 'nome'} ou None se não houver elegíveis suficientes.
+        if quantidade < 1:
+            raise ValueError(f'quantidade de sorteados inválida: {quantidade}')
+        with self._travado(data) as (dia, arquivo):
+            if quantidade > len(dia.elegiveis):
+                return None
+
+            ganhadores = []
+            for _ in range(quantidade):
+                pessoa_id = dia.elegiveis[random.randrange(len(dia.elegiveis))]
+                dia.remover(pessoa_id)
+                ganhadores.append(pessoa_id)
+
+            linhas = [[pessoa_id, dia.participantes[pessoa_id][0], '1']
+                      for pessoa_id in ganhadores]
+            self._anexar(arquivo, linhas, sincronizar=True)
+            for pessoa_id, nome, status in linhas:
+                dia.participantes[pessoa_id][1] = status
+            return [{'id': pessoa_id, 'nome': nome} for pessoa_id, nome, _ in linhas]